@@ -3,8 +3,14 @@ import folium
 from streamlit_folium import st_folium
 from streamlit_geolocation import streamlit_geolocation
 from datetime import datetime
-import logging
 import os
+import sys
+
+# The shared logging setup lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logging_setup import setup_logging  # noqa: E402
+from live_tracking import LiveTracker  # noqa: E402
+from risk_atlas import DEFAULT_PROFILE, PROFILES  # noqa: E402
 
 # Custom CSS for buttons
 st.markdown("""
@@ -32,19 +38,19 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Configure logging
-if not os.path.exists('logs'):
-    os.makedirs('logs')
+# Configure logging once per process; reruns reuse the queued handlers.
+# The file rotates daily and by size.
+logger = setup_logging(__name__, 'location_tracking.log')
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(f'logs/location_tracking_{datetime.now().strftime("%Y%m%d")}.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+# Marker colour for each predicted risk class
+RISK_COLORS = {
+    "No Damage": "green",
+    "Affected (1-9%)": "lightgreen",
+    "Minor (10-25%)": "orange",
+    "Major (26-50%)": "red",
+    "Destroyed (>50%)": "darkred",
+}
+MAP_ZOOM = 13
 
 # Title
 st.title("California Wildfire Housing Damage Risk Predictor")
@@ -55,26 +61,32 @@ if 'tracking' not in st.session_state:
     st.session_state.tracking = False  # Whether location tracking is enabled
 if 'location' not in st.session_state:
     st.session_state.location = None  # Store the current location
-if 'prev_location' not in st.session_state:
-    st.session_state.prev_location = None  # Store the previous location
+if 'live_update' not in st.session_state:
+    st.session_state.live_update = None  # Last accepted update: places and prediction
+if 'tracker' not in st.session_state:
+    st.session_state.tracker = LiveTracker(PROFILES[DEFAULT_PROFILE])
+if 'base_map' not in st.session_state:
+    # Built once per session; reruns only swap the marker layer and the centre
+    st.session_state.base_map = folium.Map(location=[37.2, -119.5], zoom_start=6)
+
+profile = st.selectbox("Building Profile", list(PROFILES), index=list(PROFILES).index(DEFAULT_PROFILE))
+tracker = st.session_state.tracker
+tracker.set_structure(PROFILES[profile])
 
 
 # Create columns for the location icon and "Stop Tracking" button
 col1, col2 = st.columns(2)
 
-if 'tracking' not in st.session_state:
-    st.session_state.tracking = False
-
+location = None
 with col1:
     # Toggle for starting/stopping tracking
     st.session_state.tracking = st.checkbox("Track Location", value=st.session_state.tracking)
-    
+
     if st.session_state.tracking:
         st.info("Please Click the icon to start sharing your location")
-    
+
         location = streamlit_geolocation()
         if location and location.get('latitude') and location.get('longitude'):
-            # st.warning("Fetching location...")
             st.session_state.location = location
             st.info("Location tracking in progress.")
 
@@ -84,49 +96,51 @@ with col2:
         st.info("Location tracking stopped.")
         st.rerun()
 
-# Update the map if location changes
-if st.session_state.tracking:
-    if location is not None and location.get('latitude') is not None and location.get('longitude') is not None:
-        st.info("Location tracking started.")
-        lat = st.session_state.location.get('latitude')
-        lon = st.session_state.location.get('longitude')
-        st.session_state.location = {'latitude': lat, 'longitude': lon}
-        
-        # Log location update if it's different from previous location    
-        if st.session_state.prev_location != (lat, lon):
-            logger.info(f"Location updated - Latitude: {lat:.6f}, Longitude: {lon:.6f}")
-            st.session_state.prev_location = (lat, lon)
-
-        # Display current location
-        st.success(f"Current Location: Latitude: {lat:.6f}, Longitude: {lon:.6f}")
-        st.text(f"Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-
-        # Display map
-        try:
-            location_map = folium.Map(location=[lat, lon], zoom_start=15)
-            folium.Marker([lat, lon], popup="Current Location", icon=folium.Icon(color='red', icon='info-sign')).add_to(location_map)
-            st_folium(location_map, width=700, height=500)
-        except Exception as e:
-            logger.error(f"Error creating map: {str(e)}")
-            st.error("Error creating map")
-else:
+# Reverse-geocode and re-score only after meaningful movement
+if st.session_state.tracking and location and location.get('latitude') is not None \
+        and location.get('longitude') is not None:
+    update = tracker.update(location['latitude'], location['longitude'], accuracy=location.get('accuracy'))
+    if update is not None:
+        st.session_state.live_update = update
+        if update["place_changed"]:
+            logger.info(f"Location updated - Latitude: {update['lat']:.6f}, Longitude: {update['lon']:.6f}, "
+                        f"place: {[p and p[0] for p in update['places'].values()]}, "
+                        f"risk: {update['prediction']['predicted_risk']}")
+
+update = st.session_state.live_update
+if update is None:
     st.info("Click the location icon to share your real-time location or stop tracking to halt updates.")
+else:
+    lat, lon = update["lat"], update["lon"]
+    prediction = update["prediction"]
+    if st.session_state.tracking:
+        st.success(f"Current Location: Latitude: {lat:.6f}, Longitude: {lon:.6f}")
+    else:
+        st.info(f"Tracking stopped. Last known location: Latitude: {lat:.6f}, Longitude: {lon:.6f}")
+    st.text(f"Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    nearest = [f"{field.title()}: {place[0]} ({place[1]:.1f} km)"
+               for field, place in update["places"].items() if place is not None]
+    st.write("Nearest known places: " + (", ".join(nearest) if nearest else "none within range"))
+    st.metric("Predicted Risk", prediction["predicted_risk"])
+    st.bar_chart(prediction["probabilities"])
 
-# Retain the last known location if tracking is stopped
-if not st.session_state.tracking and st.session_state.location:
-    # lat, lon = st.session_state.location
-    lat = st.session_state.location['latitude']
-    lon = st.session_state.location['longitude']
-    st.info(f"Tracking stopped. Last known location: Latitude: {lat:.6f}, Longitude: {lon:.6f}")
+    # Only the marker layer and centre change between updates, not the base map
     try:
-        # Display the last known location on the map
-        location_map = folium.Map(location=[lat, lon], zoom_start=15)
-        folium.Marker([lat, lon], popup="Last Known Location", icon=folium.Icon(color='blue', icon='info-sign')).add_to(location_map)
-        st_folium(location_map, width=700, height=500)
+        marker_layer = folium.FeatureGroup(name="Current Location")
+        folium.Marker(
+            [lat, lon],
+            popup=f"{'Current' if st.session_state.tracking else 'Last Known'} Location: {prediction['predicted_risk']}",
+            icon=folium.Icon(color=RISK_COLORS.get(prediction["predicted_risk"], "blue"), icon='info-sign'),
+        ).add_to(marker_layer)
+        st_folium(st.session_state.base_map, center=[lat, lon], zoom=MAP_ZOOM, feature_group_to_add=marker_layer,
+                  key="live_map", width=700, height=500, returned_objects=[])
     except Exception as e:
         logger.error(f"Error creating map: {str(e)}")
         st.error("Error creating map")
 
 # Debug Information
 if st.checkbox("Show Debug Info"):
-    st.write("Session State:", st.session_state)
\ No newline at end of file
+    st.write("Throttle:", {"accepted": tracker.throttle.accepted, "dropped": tracker.throttle.dropped,
+                           "predictions": tracker.predictions})
+    st.write("Session State:", st.session_state)
@@ -3,14 +3,16 @@ import folium
 from streamlit_folium import st_folium
 import streamlit.components.v1 as components
 import logging
+import os
+import sys
 from datetime import datetime
 
-# Configure logging with more detailed format
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+# The shared logging setup lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logging_setup import setup_logging  # noqa: E402
+
+# Configure logging once per process; reruns reuse the queued handler
+logger = setup_logging(__name__, level=logging.DEBUG)
 
 print("=== Application Starting ===")
 print(f"Initializing app at {datetime.now()}")
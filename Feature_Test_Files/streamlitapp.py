@@ -3,8 +3,12 @@ import folium
 from streamlit_folium import st_folium
 from streamlit_geolocation import streamlit_geolocation
 from datetime import datetime
-import logging
 import os
+import sys
+
+# The shared logging setup lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from logging_setup import setup_logging  # noqa: E402
 
 # Custom CSS for the button styling
 st.markdown("""
@@ -32,20 +36,9 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Create logs directory if it doesn't exist
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(f'logs/location_tracking_{datetime.now().strftime("%Y%m%d")}.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+# Configure logging once per process; reruns reuse the queued handlers.
+# The file rotates daily and by size.
+logger = setup_logging(__name__, 'location_tracking.log')
 
 st.title("California Wildfire Housing Damage Risk Predictor")
 
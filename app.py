@@ -5,26 +5,213 @@ import pickle
 import requests
 import streamlit as st
 import plotly.express as px
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from gazetteer import get_gazetteer
+from geocoding import configure_logging as configure_geocoding_logging
 from prediction import predict_risk
-from map_risk import create_map  
+from prediction import warm_up as warm_up_model
+from map_risk import FALLBACK_LAT, FALLBACK_LON, create_atlas_map, create_map, resolve_location
+from map_risk import warm_up as warm_up_map
+from mitigation import FIELD_OPTIONS, sweep as mitigation_sweep
+from place_normalizer import get_place_normalizer
+from structure_index import get_structure_index
+import metrics
+
+
+@st.cache_resource
+def start_warm_up():
+    """Load the model and map libraries once per process, in the background."""
+    # Before any lookup can run, so the geocoder's retries and breaker changes are kept
+    configure_geocoding_logging()
+
+    def warm_up():
+        warm_up_model()
+        warm_up_map()
+
+    thread = threading.Thread(target=warm_up, daemon=True)
+    thread.start()
+    return thread
+
+
+# Seconds each stage may take before the page moves on without it. The
+# prediction deadline covers loading the model on a cold start.
+PREDICTION_DEADLINE = 30.0
+GEOCODE_DEADLINE = 4.0
+SWEEP_DEADLINE = 10.0
+
+# Inspected structures shown next to a prediction, and the fields listed for each
+SIMILAR_STRUCTURES = 10
+SIMILAR_COLUMNS = {
+    "CITY": "City", "COMMUNITY": "Community", "STRUCTURET_STANDARDIZED": "Structure Type",
+    "ROOFCONSTR": "Roof", "EAVES": "Eaves", "VENTSCREEN": "Vent Screen", "EXTERIORSI": "Exterior Surface",
+    "WINDOWPANE": "Window Pane", "YEARBUILT": "Year Built",
+}
+
+# Labels for the input fields in the explanation chart and the what-if table
+FIELD_LABELS = {
+    "CITY": "City",
+    "COUNTY": "County",
+    "COMMUNITY": "Community",
+    "VEGCLERANCE": "Vegetation Clearance",
+    "STRUCTURET_STANDARDIZED": "Structure Type",
+    "ROOFCONSTRUCTR": "Roof",
+    "EAVES": "Eaves",
+    "VENTSCREEN": "Vent Screen",
+    "EXTERIORSI": "Exterior Surface",
+    "WINDOWPANE": "Window Pane",
+    "TOPOGRAPHY": "Topography",
+    "YEARBUILT": "Year Built",
+}
+
+
+@st.cache_resource
+def get_executor():
+    """Worker threads shared by every session for the request stages."""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="predict-stage")
+
+
+def probability_chart(probabilities):
+    """Build the bar chart of class probabilities."""
+    labels = list(probabilities.keys())
+    values = list(probabilities.values())
+
+    # Create Plotly bar chart
+    fig = px.bar(
+        x=labels,
+        y=values,
+        labels={"x": "Risk Categories", "y": "Probability"},
+        title="Prediction Probabilities",
+        text=values
+    )
+    fig.update_traces(texttemplate='%{text:.1%}', textposition='outside')  # Show percentages on bars
+    fig.update_layout(
+    yaxis=dict(
+            range=[0, 1.1],               # Explicitly set y-axis range from 0 to 1
+            tickvals=[i/10 for i in range(11)],  # Add ticks at 0.1, 0.2, ..., 1.0
+            tickformat=".1f"            # Format the ticks as decimal values (e.g., 0.1)
+    ),
+    xaxis_title="Risk Categories",
+        yaxis_title="Probability"
+    )
+
+    # fig.update_layout(yaxis=dict(range=[0, 1]))  # Set y-axis range to [0, 1]
+    return fig
+
+
+def contribution_chart(result):
+    """Build the bar chart of how much each input field moved the predicted category's probability."""
+    label = result["predicted_risk"]
+    contributions = sorted(
+        ((FIELD_LABELS.get(field, field.title()), values[label]) for field, values in result["contributions"].items()),
+        key=lambda item: abs(item[1]),
+    )
+    fields = [field for field, _ in contributions]
+    values = [value for _, value in contributions]
+
+    fig = px.bar(
+        x=values,
+        y=fields,
+        orientation="h",
+        color=["Raises" if value > 0 else "Lowers" for value in values],
+        color_discrete_map={"Raises": "#d62728", "Lowers": "#2ca02c"},
+        labels={"x": f"Change in probability of {label}", "y": "", "color": ""},
+        title=f"Why {label}: starting from {result['bias'][label]:.1%} before any input is considered",
+        text=values,
+    )
+    fig.update_traces(texttemplate="%{text:+.1%}", textposition="outside")
+    fig.update_layout(xaxis_tickformat="+.0%", yaxis={"categoryorder": "array", "categoryarray": fields})
+    return fig
+
+
+def mitigation_table(result):
+    """Rank the what-if variants as a table of changes and risk reduction."""
+    rows = []
+    for variant in result["variants"]:
+        if not variant["changes"]:
+            continue
+        rows.append({
+            "Changes": ", ".join(f"{FIELD_LABELS.get(field, field)}: {value}"
+                                 for field, value in variant["changes"].items()),
+            "Major or Destroyed": 100 * variant["severe_probability"],
+            "Reduction": 100 * variant["reduction"],
+            "Predicted Risk": variant["predicted_risk"],
+        })
+    return pd.DataFrame(rows)
+
+
+def similar_structures_table(neighbours):
+    """Table of the nearest inspected structures and the damage each one suffered."""
+    return pd.DataFrame([
+        {"Observed Damage": neighbour["damage"], "Fields Differing": neighbour["fields_differing"],
+         **{label: neighbour["fields"].get(column) for column, label in SIMILAR_COLUMNS.items()}}
+        for neighbour in neighbours
+    ])
+
+
+@st.cache_resource
+def start_metrics():
+    """Start the metrics exporters configured in the environment, once per process."""
+    metrics.start_from_env()
+    return True
+
+
+start_warm_up()
+start_metrics()
+
+def use_suggestion(field):
+    """Copy the picked suggestion into the place's text input."""
+    st.session_state[f"{field}_input"] = st.session_state[f"{field}_suggestion"]
+    st.session_state[f"{field}_suggestion"] = None
+
+
+def place_matches_note(raw_input, matches):
+    """Describe how the typed place names were matched to the ones the model knows."""
+    notes = []
+    for field, match in matches.items():
+        raw = raw_input[field]
+        if not raw:
+            continue
+        if match is None:
+            closest = ", ".join(m.value for m in get_place_normalizer().match(field, raw, limit=3))
+            notes.append(f"{field.title()} \"{raw}\" is not a place the model knows"
+                         + (f" (closest: {closest})." if closest else "."))
+        elif match.value != raw:
+            notes.append(f"{field.title()} \"{raw}\" read as \"{match.value}\" ({match.score:.0%} match).")
+    return notes
+
+
+def place_input(column, label, field, placeholder):
+    """Free-text place input with type-ahead suggestions from the gazetteer."""
+    column.markdown(f"**{label}**")
+    value = column.text_input(label, key=f"{field}_input", placeholder=placeholder, label_visibility="collapsed")
+    suggestions = [name for name in get_gazetteer().complete(field, value) if name != value]
+    if suggestions:
+        column.pills(
+            f"{label} suggestions",
+            suggestions,
+            key=f"{field}_suggestion",
+            on_change=use_suggestion,
+            args=(field,),
+            label_visibility="collapsed"
+        )
+    return value
+
 
 st.title("California Wildfire Housing Damage Risk Predictor")
 
 # Input: CITY, COUNTY, COMMUNITY
 with st.container():
     col1, col2, col3 = st.columns(3)
-    col1.markdown("**City**")
-    city = col1.text_input("City", placeholder="Enter the city name", label_visibility="collapsed")
-    col2.markdown("**County**")
-    county = col2.text_input("County", placeholder="Enter the county name", label_visibility="collapsed")
-    col3.markdown("**Community**")
-    community = col3.text_input("Community", placeholder="Enter the community name", label_visibility="collapsed")
+    city = place_input(col1, "City", "CITY", "Enter the city name")
+    county = place_input(col2, "County", "COUNTY", "Enter the county name")
+    community = place_input(col3, "Community", "COMMUNITY", "Enter the community name")
 
 # Input: Vegetation Clearance
 st.markdown("**Vegetation Clearance (distance in feet)**")
 veg_clearance = st.selectbox(
     "Vegetation Clearance",
-    ["""0-30'""", """30-60'""", """60-100'""", """>100'""", "Unknown"],
+    FIELD_OPTIONS["VEGCLERANCE"],
     label_visibility="collapsed"
 )
 
@@ -34,25 +221,21 @@ with st.container():
     col1.markdown("**Structure Type**")
     structure_type = col1.selectbox(
         "Structure Type",
-        ["Single Family Residence", "Mobile Home", "Non-habitable",
-        "Outbuilding", "Commercial Building", "Multi Family Residence",
-        "Public Building", "Mixed Use", "Other"],
+        FIELD_OPTIONS["STRUCTURET_STANDARDIZED"],
         label_visibility="collapsed"
     )
 
     col2.markdown("**Roof Construction Type**")
     roof_construction = col2.selectbox(
         "Roof Construction Type",
-        ["Asphalt", "Fire Resistant", "Metal", "Unknown",
-        "Tile", "Combustible", "Wood", "Concrete", "Other"],
+        FIELD_OPTIONS["ROOFCONSTRUCTR"],
         label_visibility="collapsed"
     )
 
     col3.markdown("**Eaves Type**")
     eaves = col3.selectbox(
         "Eaves Type",
-        ["Unknown", "Unenclosed", "Enclosed",
-        "No Eaves", "Not Applicable"],
+        FIELD_OPTIONS["EAVES"],
         label_visibility="collapsed"
     )
 
@@ -62,23 +245,21 @@ with st.container():
     col1.markdown("**Vent Screen Type**")
     vent_screen = col1.selectbox(
         "Vent Screen Type",
-        ["Yes", "No", "Mesh Screen <= 1/8",
-        "No Vents", "Unscreened", "Mesh Screen > 1/8", "Unknown"],
+        FIELD_OPTIONS["VENTSCREEN"],
         label_visibility="collapsed"
     )
 
     col2.markdown("**Exterior Surface Type**")
     exterior_surface = col2.selectbox(
         "Exterior Surface Type",
-        ["Combustible", "Ignition Resistant",
-        "Fire Resistant", "Unknown"],
+        FIELD_OPTIONS["EXTERIORSI"],
         label_visibility="collapsed"
     )
 
     col3.markdown("**Window Pane Type**")
     window_pane = col3.selectbox(
         "Window Pane Type",
-        ["Single Pane", "No Windows", "Multi Pane", "Unknown"],
+        FIELD_OPTIONS["WINDOWPANE"],
         label_visibility="collapsed"
     )
 
@@ -88,7 +269,7 @@ with st.container():
     col1.markdown("**Topography**")
     topography = col1.selectbox(
         "Topography",
-        ["Flat Ground", "Slope", "Ridge Top", "Saddle", "Chimney", "Unknown"],
+        FIELD_OPTIONS["TOPOGRAPHY"],
         label_visibility="collapsed"
     )
 
@@ -126,13 +307,23 @@ if predict_button:
         "YEARBUILT": year_built
     }
 
-    # Make prediction
-    result = predict_risk(user_input)
+    # Map free-text places to the closest names the model was trained on
+    raw_input = user_input
+    user_input, place_matches = get_place_normalizer().normalize_record(raw_input)
+    city, county, community = user_input["CITY"], user_input["COUNTY"], user_input["COMMUNITY"]
+    for note in place_matches_note(raw_input, place_matches):
+        st.caption(note)
 
-    # Display the map
+    # Geocoding and inference are independent, so run them side by side
+    executor = get_executor()
+    location_future = executor.submit(resolve_location, city, county, community)
+    prediction_future = executor.submit(predict_risk, user_input)
+    sweep_future = executor.submit(mitigation_sweep, user_input, limit=10)
+
+    # Sections keep their order on the page and fill in as results arrive
     st.subheader("Location Map")
-    map_figure = create_map(city, county, community, result['probabilities'])
-    st.plotly_chart(map_figure)
+    map_placeholder = st.empty()
+    map_placeholder.caption("Locating...")
     # # Display results
     # st.subheader("Prediction Results")
     # st.write(f"Predicted Risk Class: **{result['predicted_risk']}**")
@@ -140,33 +331,81 @@ if predict_button:
     # st.write("Prediction Probabilities:")
     # for label, prob in result["probabilities"].items():
     #     st.write(f"- {label}: {prob:.2%}")
-        
+
     # Display Bar Plot using Plotly
     st.subheader("Prediction Probabilities Visualization")
-    probabilities = result["probabilities"]
-    labels = list(probabilities.keys())
-    values = list(probabilities.values())
+    chart_placeholder = st.empty()
 
-    # Create Plotly bar chart
-    fig = px.bar(
-        x=labels,
-        y=values,
-        labels={"x": "Risk Categories", "y": "Probability"},
-        title="Prediction Probabilities",
-        text=values
-    )
-    fig.update_traces(texttemplate='%{text:.1%}', textposition='outside')  # Show percentages on bars
-    fig.update_layout(
-    yaxis=dict(
-            range=[0, 1.1],               # Explicitly set y-axis range from 0 to 1
-            tickvals=[i/10 for i in range(11)],  # Add ticks at 0.1, 0.2, ..., 1.0
-            tickformat=".1f"            # Format the ticks as decimal values (e.g., 0.1)
-    ),
-    xaxis_title="Risk Categories",
-        yaxis_title="Probability"
-    )
-
-    # fig.update_layout(yaxis=dict(range=[0, 1]))  # Set y-axis range to [0, 1]
+    # Make prediction
+    try:
+        result = prediction_future.result(timeout=PREDICTION_DEADLINE)
+    except FutureTimeoutError:
+        map_placeholder.empty()
+        chart_placeholder.error("The prediction took too long. Please try again.")
+        st.stop()
 
     # Display the plot in Streamlit
-    st.plotly_chart(fig)
\ No newline at end of file
+    chart_placeholder.plotly_chart(probability_chart(result["probabilities"]))
+
+    # Per-field contributions from the trees' decision paths
+    st.subheader("Why This Prediction")
+    st.caption("How much each input moved the probability of the predicted category, summed over the "
+               "decision paths of every tree in the forest.")
+    st.plotly_chart(contribution_chart(result))
+
+    # A slow geocoder only costs map precision; its answer is still cached for next time
+    try:
+        location = location_future.result(timeout=GEOCODE_DEADLINE)
+    except FutureTimeoutError:
+        location = (FALLBACK_LAT, FALLBACK_LON, True)
+
+    # Display the map
+    map_figure = create_map(city, county, community, result['probabilities'], location=location)
+    with map_placeholder.container():
+        if map_figure is None:
+            st.warning("The map could not be created for this location.")
+        else:
+            if map_figure.layout.meta and map_figure.layout.meta.get("approximate_location"):
+                st.info("Approximate location: this place could not be found, so the map is centred on Butte County.")
+            st.plotly_chart(map_figure)
+
+    # Statewide comparison from the precomputed atlas, when it has been built
+    atlas_figure = create_atlas_map(location)
+    if atlas_figure is not None:
+        st.subheader("Statewide Comparison")
+        st.caption("Precomputed risk of major damage or destruction for a representative building in each known place.")
+        st.plotly_chart(atlas_figure)
+
+    # The most similar structures CAL FIRE actually inspected, when the index has been built
+    structure_index = get_structure_index()
+    if structure_index is not None:
+        neighbours = structure_index.similar(user_input, k=SIMILAR_STRUCTURES)
+        st.subheader("Similar Inspected Structures")
+        counts = structure_index.damage_counts(neighbours)
+        st.caption(f"The {len(neighbours)} most similar of {len(structure_index):,} structures in the DINS data: "
+                   + ", ".join(f"{count} {label}" for label, count in counts.items()) + ".")
+        st.dataframe(similar_structures_table(neighbours), hide_index=True)
+
+    # What-if: the retrofits that cut the chance of major damage the most
+    st.subheader("Mitigation Options")
+    try:
+        sweep_result = sweep_future.result(timeout=SWEEP_DEADLINE)
+    except FutureTimeoutError:
+        st.warning("The mitigation comparison took too long. Please try again.")
+        st.stop()
+
+    baseline = sweep_result["baseline"]["severe_probability"]
+    st.caption(f"Compared {sweep_result['evaluated']:,} combinations of retrofit options. "
+               f"Chance of major damage or destruction as built: {baseline:.1%}.")
+    table = mitigation_table(sweep_result)
+    if table.empty or table["Reduction"].max() <= 0:
+        st.info("None of the retrofit options lowers the predicted risk for this structure.")
+    else:
+        st.dataframe(
+            table[table["Reduction"] > 0],
+            hide_index=True,
+            column_config={
+                "Major or Destroyed": st.column_config.NumberColumn(format="%.1f%%"),
+                "Reduction": st.column_config.NumberColumn(format="%.1f%%"),
+            },
+        )
@@ -0,0 +1,268 @@
+"""
+Score large structure extracts (CSV or Parquet) in fixed-size chunks.
+
+Each chunk is encoded as one block and sent to the model in a single
+predict_proba call; results are appended to a CSV so memory stays flat
+regardless of input size. With --workers, chunks are scored by a process
+pool over one shared copy of the model and still written in input order.
+With --normalize-places, misspelled or partial CITY/COUNTY/COMMUNITY values
+are first mapped to the closest names the model knows (place_normalizer.py).
+With --explain, each row also gets one C(<field>) column per input field: how
+much that field moved the probability of the predicted risk (see
+prediction.get_contribution_fields).
+A checkpoint file next to the output records the last completed chunk so
+an interrupted run can be resumed with --resume.
+
+Usage:
+    python batch_score.py parcels.parquet scores.csv --chunk-size 50000
+    python batch_score.py parcels.csv scores.csv --id-column APN --resume
+    python batch_score.py county.parquet scores.csv --workers 8
+    python batch_score.py survey.csv scores.csv --normalize-places
+    python batch_score.py parcels.csv scores.csv --explain
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import parallel_scoring
+import prediction
+from place_normalizer import get_place_normalizer
+
+# Type every input column is read as, in every chunk (see read_chunks)
+INPUT_DTYPE = str
+
+
+def read_chunks(input_path, chunk_size, columns, skip_rows=0):
+    """
+    Yield DataFrame chunks of at most ``chunk_size`` rows from a CSV or Parquet file.
+
+    Every column is read as text (INPUT_DTYPE), whatever the format or the
+    values in a chunk: left to infer, read_csv makes YEARBUILT an int in a
+    chunk of plain years (which matches no feature) and a string in a chunk
+    that also holds "Unknown", so predictions would depend on the chunking.
+
+    Args:
+        input_path (str): Path to a .csv or .parquet file, or a directory
+            of Parquet parts written by ingest.py. Only ``columns`` are read.
+        chunk_size (int): Rows per chunk.
+        columns (list): Columns to read; columns missing from the file are skipped.
+        skip_rows (int): Number of leading data rows to skip (used when resuming).
+    """
+    if ingest.is_parquet(input_path):
+        yield from ingest.iter_batches(input_path, columns, chunk_size, skip_rows=skip_rows, dtype=INPUT_DTYPE)
+    else:
+        wanted = set(columns)
+        yield from pd.read_csv(
+            input_path,
+            usecols=lambda c: c in wanted,
+            skiprows=range(1, skip_rows + 1),
+            chunksize=chunk_size,
+            dtype=INPUT_DTYPE,
+        )
+
+
+def load_checkpoint(checkpoint_path, input_path, chunk_size, options=None):
+    """
+    Return the saved progress for this input, or None if there is nothing to resume.
+
+    ``options`` (the output header, the flags that shape it and the input dtype) must match
+    the ones saved, so resumed rows line up with the header already written.
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as file:
+        checkpoint = json.load(file)
+    if checkpoint["input"] != os.path.abspath(input_path) or checkpoint["chunk_size"] != chunk_size:
+        raise SystemExit(f"Checkpoint {checkpoint_path} was written for a different input or chunk size.")
+    if checkpoint.get("options") != options:
+        raise SystemExit(f"Checkpoint {checkpoint_path} was written with a different header, --id-column, "
+                         f"--normalize-places, --explain or input dtype.")
+    return checkpoint
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """Atomically replace the checkpoint file."""
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def merge_unmatched(total, unmatched):
+    for column, counts in unmatched.items():
+        column_total = total.setdefault(column, {})
+        for value, count in counts.items():
+            column_total[value] = column_total.get(value, 0) + count
+
+
+def merge_normalized(total, changed, inputs):
+    """Add one chunk's place replacements to ``total``: {field: {raw: [value, score, rows]}}."""
+    for field, mapping in changed.items():
+        column_total = total.setdefault(field, {})
+        counts = inputs[field].value_counts()
+        for raw, match in mapping.items():
+            entry = column_total.setdefault(raw, [match.value, match.score, 0])
+            entry[2] += int(counts.get(raw, 0))
+
+
+def score_file(input_path, output_path, chunk_size=10000, id_columns=(), resume=False, workers=1,
+               normalize_places=False, explain=False, log=sys.stderr):
+    """
+    Score every row of ``input_path`` and stream the results to ``output_path``.
+
+    Args:
+        input_path (str): CSV or Parquet file with the app's input fields.
+        output_path (str): CSV file to write predictions to.
+        chunk_size (int): Rows encoded and scored per model call.
+        id_columns (sequence): Input columns copied through to the output.
+        resume (bool): Continue after the last completed chunk of a previous run.
+        workers (int): Scoring processes. Above 1, chunks are scored in a
+            process pool sharing one copy of the model (see parallel_scoring.py)
+            and written in input order.
+        normalize_places (bool): Replace place values with their closest
+            known names before scoring (see place_normalizer.py).
+        explain (bool): Add a C(<field>) column per contribution field with
+            its contribution to the predicted risk's probability.
+        log (file): Where progress lines are printed.
+
+    Returns:
+        dict: Rows scored, elapsed seconds, unmatched input value counts and
+        the place replacements made ({field: {raw: [value, score, rows]}}).
+    """
+    class_names = prediction.get_class_names()
+    probability_columns = [f"P({label})" for label in class_names]
+    contribution_columns = [f"C({field})" for field in prediction.get_contribution_fields()[1]] if explain else []
+    header = ["row", *id_columns, "predicted_risk", *probability_columns, *contribution_columns]
+    options = {
+        "header": header,
+        "id_columns": list(id_columns),
+        "normalize_places": normalize_places,
+        "explain": explain,
+        "input_dtype": INPUT_DTYPE.__name__,
+    }
+
+    checkpoint_path = output_path + ".checkpoint"
+    checkpoint = load_checkpoint(checkpoint_path, input_path, chunk_size, options) if resume else None
+    if checkpoint is None:
+        checkpoint = {
+            "input": os.path.abspath(input_path),
+            "chunk_size": chunk_size,
+            "options": options,
+            "chunks_done": 0,
+            "rows_done": 0,
+            "output_bytes": 0,
+        }
+    elif checkpoint["chunks_done"]:
+        print(f"Resuming after chunk {checkpoint['chunks_done']} ({checkpoint['rows_done']} rows).", file=log)
+
+    output = open(output_path, "r+b" if checkpoint["output_bytes"] else "wb")
+    # Drop anything written after the last completed chunk
+    output.truncate(checkpoint["output_bytes"])
+    output.seek(checkpoint["output_bytes"])
+    if not checkpoint["output_bytes"]:
+        output.write((",".join(header) + "\n").encode())
+
+    unmatched_total = {}
+    normalized_total = {}
+    normalizer = get_place_normalizer() if normalize_places else None
+
+    def model_inputs(chunk):
+        inputs = chunk[[c for c in chunk.columns if c in prediction.INPUT_FIELDS]]
+        if normalizer is not None:
+            normalized, changed = normalizer.normalize_frame(inputs)
+            merge_normalized(normalized_total, changed, inputs)
+            inputs = normalized
+        return inputs
+
+    rows_at_start = checkpoint["rows_done"]
+    started = time.perf_counter()
+    scorer = None
+    try:
+        chunks = read_chunks(input_path, chunk_size, [*prediction.INPUT_FIELDS, *id_columns],
+                             skip_rows=checkpoint["rows_done"])
+        pairs = ((model_inputs(chunk), chunk) for chunk in chunks)
+        if workers > 1:
+            scorer = parallel_scoring.ParallelScorer.from_prediction(workers, explain=explain)
+            results = scorer.imap(pairs)
+        else:
+            results = ((chunk, prediction.predict_batch(inputs, explain=explain)) for inputs, chunk in pairs)
+
+        for chunk, (predicted_risk, probabilities, unmatched, *contributions) in results:
+            merge_unmatched(unmatched_total, unmatched)
+
+            result = pd.DataFrame(probabilities, columns=probability_columns)
+            if explain:
+                # Each field's share of the predicted risk's probability
+                predicted = np.argmax(probabilities, axis=1)
+                explained = contributions[0][np.arange(len(predicted)), :, predicted]
+                result[contribution_columns] = explained
+            result.insert(0, "predicted_risk", predicted_risk)
+            for position, column in enumerate(id_columns):
+                result.insert(position, column, chunk[column].to_numpy())
+            result.insert(0, "row", range(checkpoint["rows_done"], checkpoint["rows_done"] + len(chunk)))
+            output.write(result.to_csv(header=False, index=False, quoting=csv.QUOTE_MINIMAL).encode())
+            output.flush()
+            os.fsync(output.fileno())
+
+            checkpoint["chunks_done"] += 1
+            checkpoint["rows_done"] += len(chunk)
+            checkpoint["output_bytes"] = output.tell()
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            elapsed = time.perf_counter() - started
+            rows = checkpoint["rows_done"] - rows_at_start
+            print(f"chunk {checkpoint['chunks_done']}: {checkpoint['rows_done']} rows "
+                  f"({rows / elapsed:,.0f} rows/s)", file=log)
+    finally:
+        output.close()
+        if scorer is not None:
+            scorer.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": checkpoint["rows_done"] - rows_at_start,
+        "seconds": elapsed,
+        "unmatched": unmatched_total,
+        "normalized": normalized_total,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-score structures with the wildfire risk model.")
+    parser.add_argument("input", help="CSV or Parquet file with one structure per row")
+    parser.add_argument("output", help="CSV file to write predictions to")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="rows per model call (default: 10000)")
+    parser.add_argument("--id-column", action="append", default=[], dest="id_columns",
+                        help="input column to copy to the output (repeatable)")
+    parser.add_argument("--resume", action="store_true", help="continue from the last completed chunk")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="scoring processes sharing one model copy (default: 1, in-process)")
+    parser.add_argument("--normalize-places", action="store_true",
+                        help="map place values to the closest names the model knows before scoring")
+    parser.add_argument("--explain", action="store_true",
+                        help="add each input field's contribution to the predicted risk")
+    args = parser.parse_args(argv)
+
+    summary = score_file(args.input, args.output, chunk_size=args.chunk_size,
+                         id_columns=args.id_columns, resume=args.resume, workers=args.workers,
+                         normalize_places=args.normalize_places, explain=args.explain)
+
+    print(f"Scored {summary['rows']} rows in {summary['seconds']:.1f}s.", file=sys.stderr)
+    for column, counts in summary["unmatched"].items():
+        top = sorted(counts.items(), key=lambda item: -item[1])[:5]
+        print(f"Unmatched {column}: " + ", ".join(f"{value!r} x{count}" for value, count in top), file=sys.stderr)
+    for column, replacements in summary["normalized"].items():
+        top = sorted(replacements.items(), key=lambda item: -item[1][2])[:5]
+        print(f"Normalized {column}: " + ", ".join(f"{raw!r} -> {value!r} ({score:.2f}) x{rows}"
+                                                   for raw, (value, score, rows) in top), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark the prediction and mapping hot paths.
+
+Every case is run over synthetic app inputs (see synthetic.py) and reports
+p50/p95/p99 latency in milliseconds and the peak memory allocated by one call
+(tracemalloc, measured in a separate pass so it does not skew the timings).
+Module import times are measured in fresh interpreters as in import_time.py.
+The geocoder is replaced by an in-process stub, so runs need no network.
+
+Results are written as JSON so runs can be compared over time:
+
+    python benchmarks/hot_paths.py --output bench-$(git rev-parse --short HEAD).json
+    python benchmarks/hot_paths.py --quick
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import geocoding  # noqa: E402
+import map_risk  # noqa: E402
+import prediction  # noqa: E402
+from import_time import IMPORT_BUDGETS_MS, measure_import  # noqa: E402
+from synthetic import synthetic_records  # noqa: E402
+
+# Calls sampled for the peak-memory pass of each case
+MEMORY_SAMPLES = 20
+
+
+class StubGeocoder:
+    """Offline stand-in for geocoding.Geocoder: a fixed point per place, no I/O."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def geocode(self, city, county, community):
+        self.calls += 1
+        key = zlib.crc32(geocoding.normalize_location(city, county, community).encode())
+        # Somewhere in Northern California, stable per place
+        return 38.0 + (key % 2000) / 1000, -123.0 + (key // 2000 % 2000) / 1000
+
+    @property
+    def session(self):
+        return None
+
+    def close(self):
+        pass
+
+
+def percentiles(samples):
+    samples_ms = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {"calls": len(samples), "p50_ms": p50, "p95_ms": p95, "p99_ms": p99,
+            "mean_ms": samples_ms.mean()}
+
+
+def run_case(function, inputs, warm_up=3):
+    """
+    Time ``function(x)`` for every ``x`` in ``inputs`` and measure its peak allocation.
+
+    Returns:
+        dict: Call count, latency percentiles and ``peak_kib``.
+    """
+    for x in inputs[:warm_up]:
+        function(x)
+
+    samples = []
+    for x in inputs:
+        started = time.perf_counter()
+        function(x)
+        samples.append(time.perf_counter() - started)
+    result = percentiles(samples)
+
+    peak = 0
+    tracemalloc.start()
+    try:
+        for x in inputs[:MEMORY_SAMPLES]:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            function(x)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    result["peak_kib"] = peak / 1024
+    return result
+
+
+def build_cases(records, batch_size):
+    """Return {case name: (function, inputs)} for every benchmarked path."""
+    probabilities = prediction.predict_risk(records[0])["probabilities"]
+    places = [(r["CITY"], r["COUNTY"], r["COMMUNITY"]) for r in records]
+    batches = [records[i:i + batch_size] for i in range(0, len(records) - batch_size + 1, batch_size)]
+    locations = [map_risk.resolve_location(*place)[:2] for place in places]
+
+    # Cache hits: a small working set that fits the prediction cache, seen before
+    repeated = records[:100] * max(1, len(records) // 100)
+    for record in records[:100]:
+        prediction.predict_risk(record)
+
+    return {
+        "encode": (prediction.preprocess_input, records),
+        "predict_single_uncached": (prediction._predict_risk, records),
+        "predict_single_cached": (prediction.predict_risk, repeated),
+        f"predict_batch_{batch_size}": (prediction.predict_batch, batches),
+        "resolve_location": (lambda place: map_risk.resolve_location(*place), places),
+        "heatmap_grid_11": (lambda loc: map_risk.heatmap_grid(*loc, 0.8), locations),
+        "heatmap_grid_101": (lambda loc: map_risk.heatmap_grid(*loc, 0.8, resolution=101), locations),
+        "create_map": (lambda place: map_risk.create_map(*place, probabilities), places[:200]),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    import sklearn
+
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "scikit-learn": sklearn.__version__,
+        "model_classes": [str(label) for label in prediction.get_class_names()],
+        "n_features": len(prediction.get_feature_names()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the prediction and mapping hot paths.")
+    parser.add_argument("--records", type=int, default=2000, help="synthetic inputs per case (default: 2000)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per predict_batch call")
+    parser.add_argument("--import-repeat", type=int, default=5, help="fresh interpreters per import measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="small run for a fast sanity check")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.records, args.batch_size, args.import_repeat = 200, 100, 1
+
+    geocoding.set_geocoder(StubGeocoder())
+    # The map module logs every call; keep that out of the timings
+    map_risk.logger.disabled = True
+
+    prediction.warm_up()
+    records = synthetic_records(args.records, args.seed)
+    report = {"environment": environment(), "cases": {}, "imports": {}}
+
+    for name, (function, inputs) in build_cases(records, args.batch_size).items():
+        result = run_case(function, inputs)
+        report["cases"][name] = result
+        print(f"{name:<24} p50 {result['p50_ms']:8.3f} ms  p95 {result['p95_ms']:8.3f} ms  "
+              f"p99 {result['p99_ms']:8.3f} ms  peak {result['peak_kib']:9.1f} KiB", file=sys.stderr)
+
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        elapsed = measure_import(module, args.import_repeat)
+        report["imports"][module] = {"ms": elapsed, "budget_ms": budget}
+        print(f"import {module:<17} {elapsed:8.1f} ms", file=sys.stderr)
+
+    output = json.dumps(report, indent=2, default=float)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Check that importing the app's modules stays within a time budget.
+
+Each module is imported in a fresh interpreter several times and the median
+wall time of the ``import`` statement is compared with its budget. Exits with
+status 1 when any module is over budget.
+
+Usage:
+    python benchmarks/import_time.py [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds. The modules only need numpy at import time; loading the forest,
+# the plotting libraries and the geocoder's HTTP stack is deferred to first use.
+# numpy alone takes about 80 ms to import, so every module that needs it gets
+# the same 150 ms; map_risk had 50 ms only while it imported no numpy.
+IMPORT_BUDGETS_MS = {
+    "feature_encoder": 150,
+    "prediction": 150,
+    "map_risk": 150,
+}
+
+_MEASURE = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+
+def measure_import(module, repeat=5):
+    """Return the median import time of ``module`` in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _MEASURE.format(module=module)],
+            cwd=REPO_DIR, check=True, capture_output=True, text=True,
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure module import times against their budgets.")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module (default: 5)")
+    args = parser.parse_args(argv)
+
+    over_budget = False
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        elapsed = measure_import(module, args.repeat)
+        status = "ok" if elapsed <= budget else "OVER BUDGET"
+        over_budget |= elapsed > budget
+        print(f"{module:<16} {elapsed:8.1f} ms  (budget {budget} ms)  {status}")
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
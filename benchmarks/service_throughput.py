@@ -0,0 +1,85 @@
+"""
+Compare the inference service's throughput with and without micro-batching.
+
+The service is started in-process twice on a free port: once scoring each
+request on its own (window 0, batch size 1) and once with the batching
+window. Each run sends the same number of single-structure requests with a
+fixed number in flight, and reports requests per second, latency
+percentiles and the number of model calls.
+
+Usage:
+    python benchmarks/service_throughput.py [--requests 2000] [--concurrency 64]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tornado.httpclient  # noqa: E402
+import tornado.httpserver  # noqa: E402
+import tornado.netutil  # noqa: E402
+
+import inference_service  # noqa: E402
+import prediction  # noqa: E402
+from synthetic import synthetic_records  # noqa: E402
+
+
+async def run(batcher, n_requests, concurrency, seed=0):
+    sockets = tornado.netutil.bind_sockets(0, "127.0.0.1")
+    port = sockets[0].getsockname()[1]
+    service = inference_service.InferenceService(batcher)
+    server = tornado.httpserver.HTTPServer(service.application)
+    server.add_sockets(sockets)
+    batcher.start()
+    await asyncio.get_running_loop().run_in_executor(batcher.executor, prediction.warm_up)
+
+    client = tornado.httpclient.AsyncHTTPClient(max_clients=concurrency)
+    bodies = [json.dumps(record) for record in synthetic_records(n_requests, seed)]
+    latencies = []
+    remaining = iter(bodies)
+
+    async def worker():
+        for body in remaining:
+            started = time.perf_counter()
+            await client.fetch(f"http://127.0.0.1:{port}/predict", method="POST", body=body)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    server.stop()
+    await batcher.stop()
+    latencies.sort()
+    return {
+        "requests_per_s": n_requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000,
+        "model_calls": batcher.stats["batches"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--window-ms", type=float, default=inference_service.BATCH_WINDOW * 1000)
+    args = parser.parse_args(argv)
+
+    runs = {
+        "one call per request": inference_service.MicroBatcher(window=0, max_batch_size=1),
+        f"micro-batched ({args.window_ms:g} ms)": inference_service.MicroBatcher(window=args.window_ms / 1000),
+    }
+    for name, batcher in runs.items():
+        result = asyncio.run(run(batcher, args.requests, args.concurrency))
+        print(f"{name:28s} {result['requests_per_s']:8.0f} req/s  p50 {result['p50_ms']:6.1f} ms  "
+              f"p99 {result['p99_ms']:6.1f} ms  {result['model_calls']} model calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Synthetic app inputs for benchmarks.
+
+Values are drawn from the categories the model was trained on (the one-hot
+names in ``all_feature_names.pkl``), keyed by the app's input fields, with a
+small share of values the model has never seen, as free-text place inputs
+produce in practice.
+"""
+import random
+
+import prediction
+from prediction import FEATURE_PREFIXES
+
+# Share of free-text place values that are not model categories
+UNKNOWN_PLACE_RATE = 0.05
+
+
+def field_categories(feature_names=None):
+    """Return {input field: [category, ...]} for every field in prediction.INPUT_FIELDS."""
+    feature_names = prediction.get_feature_names() if feature_names is None else feature_names
+    categories = {}
+    for field in prediction.INPUT_FIELDS:
+        prefix = FEATURE_PREFIXES.get(field, field) + "_"
+        categories[field] = [name[len(prefix):] for name in feature_names if name.startswith(prefix)]
+
+    # The app sends the year as an integer
+    categories["YEARBUILT"] = [int(year) for year in categories["YEARBUILT"]
+                               if year.isdigit() and int(year) >= 1800]
+    return categories
+
+
+def synthetic_records(n, seed=0, feature_names=None):
+    """Return ``n`` input dicts shaped like the app's ``user_input``."""
+    rng = random.Random(seed)
+    categories = field_categories(feature_names)
+    records = []
+    for i in range(n):
+        record = {field: rng.choice(values) for field, values in categories.items()}
+        for field in ("CITY", "COMMUNITY"):
+            if rng.random() < UNKNOWN_PLACE_RATE:
+                record[field] = f"Unlisted Place {i}"
+        records.append(record)
+    return records
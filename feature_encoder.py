@@ -0,0 +1,293 @@
+import numbers
+
+import numpy as np
+
+# The forest casts its input to float32 before walking the trees, so encoding
+# straight into float32 avoids a second copy inside scikit-learn.
+FEATURE_DTYPE = np.float32
+
+
+class FeatureEncoder:
+    """
+    One-hot encoder compiled from the model's training feature names.
+
+    Produces the same values as running ``pd.get_dummies`` on a one-row
+    DataFrame and reindexing against ``feature_names``, without building any
+    DataFrames:
+
+    * string (and other non-numeric) values set the ``f"{column}_{value}"``
+      column when the model knows it;
+    * numeric values (e.g. an integer ``YEARBUILT``) are passed through
+      unchanged only when the bare column name is itself a feature, which is
+      what ``reindex`` does with columns ``get_dummies`` leaves alone;
+    * ``None`` sets nothing.
+
+    Input fields listed in ``aliases`` are read as the column they map to, as
+    if renamed before ``get_dummies`` (the app's VEGCLERANCE for the
+    truncated VEGCLEARAN columns the model was trained on). prediction's
+    encoder has none, so model input stays exactly get_dummies + reindex;
+    the structure index uses them to compare with its stored rows.
+
+    Anything that did not land in a feature column is reported back to the
+    caller as "unmatched", under the input field's own name.
+    """
+
+    def __init__(self, feature_names, aliases=None):
+        self.feature_names = list(feature_names)
+        self.n_features = len(self.feature_names)
+        self.aliases = dict(aliases or {})
+
+        # Bare names, used for numeric pass-through columns
+        self.numeric_index = {name: i for i, name in enumerate(self.feature_names)}
+
+        # (column, value) -> index. A dummy name such as
+        # "STRUCTURET_STANDARDIZED_Mobile Home" is registered under every
+        # possible split at "_", so a lookup matches exactly when
+        # f"{column}_{value}" equals the feature name, as in get_dummies.
+        self.index = {}
+        for i, name in enumerate(self.feature_names):
+            start = name.find("_")
+            while start != -1:
+                self.index.setdefault((name[:start], name[start + 1:]), i)
+                start = name.find("_", start + 1)
+
+    @classmethod
+    def from_frame(cls, frame):
+        """
+        Build an encoder for a training frame.
+
+        The feature names are the columns ``pd.get_dummies(frame)`` would
+        produce, in the same order: numeric columns first, then one column
+        per category of each object/string/categorical column (categories
+        sorted, missing values dropped). Object columns should hold strings;
+        numbers in them are passed through or dropped as by ``encode``.
+
+        Args:
+            frame (pd.DataFrame): The training inputs.
+
+        Returns:
+            FeatureEncoder: Encoder whose ``encode_batch(frame)`` equals
+            ``pd.get_dummies(frame)`` as float32.
+        """
+        import pandas as pd
+
+        numeric, dummies = [], []
+        for column in frame.columns:
+            dtype = frame[column].dtype
+            if isinstance(dtype, pd.CategoricalDtype):
+                categories = dtype.categories
+            elif pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+                categories = pd.Categorical(frame[column]).categories
+            else:
+                numeric.append(column)
+                continue
+            dummies.extend(f"{column}_{category}" for category in categories)
+        return cls(numeric + dummies)
+
+    def lookup(self, column, value):
+        """
+        Return the feature index a single input value is written to, or None.
+
+        Args:
+            column (str): Input field name, e.g. "ROOFCONSTRUCTR".
+            value: The raw value for that field.
+
+        Returns:
+            int or None: Position in ``feature_names`` or None when unmatched.
+        """
+        if value is None:
+            return None
+        column = self.aliases.get(column, column)
+        if isinstance(value, (numbers.Number, np.bool_)):
+            return self.numeric_index.get(column)
+        return self.index.get((column, str(value)))
+
+    def canonical(self, column, value):
+        """
+        Return a normalized form of one input value.
+
+        Two values with the same canonical form encode identically: the
+        feature name for one-hot values, (name, float value) for numeric
+        pass-through values, and None for anything unmatched.
+        """
+        position = self.lookup(column, value)
+        if position is None:
+            return None
+        if isinstance(value, (numbers.Number, np.bool_)):
+            return (self.feature_names[position], float(value))
+        return self.feature_names[position]
+
+    def _write(self, row, column, value):
+        position = self.lookup(column, value)
+        if position is None:
+            return False
+        if isinstance(value, (numbers.Number, np.bool_)):
+            row[position] = value
+        else:
+            row[position] = 1
+        return True
+
+    def encode(self, record, out=None):
+        """
+        Encode one input record.
+
+        Args:
+            record (dict): Input fields, as built from the app's form.
+            out (np.ndarray, optional): Preallocated (1, n_features) or
+                (n_features,) array to write into. It is zeroed first.
+
+        Returns:
+            tuple: (np.ndarray of shape (1, n_features), dict of the
+            {column: value} pairs that had no matching feature column).
+        """
+        if out is None:
+            out = np.zeros((1, self.n_features), dtype=FEATURE_DTYPE)
+        else:
+            out[...] = 0
+        row = out.reshape(-1)
+
+        unmatched = {}
+        for column, value in record.items():
+            if not self._write(row, column, value):
+                unmatched[column] = value
+
+        return out, unmatched
+
+    def encode_batch(self, records, out=None, sparse=False):
+        """
+        Encode many records into an (N, n_features) matrix.
+
+        Every row is encoded exactly as ``encode`` would encode it on its own.
+
+        Args:
+            records (pd.DataFrame or list of dict): The inputs. DataFrames are
+                encoded column by column over their distinct values.
+            out (np.ndarray, optional): Preallocated (N, n_features) array to
+                write into. It is zeroed first. Not used when ``sparse``.
+            sparse (bool): Return a ``scipy.sparse.csr_matrix`` holding only
+                the non-zero entries (about a dozen per row instead of
+                n_features). ``.toarray()`` equals the dense result.
+
+        Returns:
+            tuple: (np.ndarray or csr_matrix of shape (N, n_features), dict
+            mapping each column with unmatched values to a {value: row count} dict).
+        """
+        if sparse:
+            return self._encode_sparse(records)
+        if hasattr(records, "columns"):
+            return self._encode_frame(records, out)
+
+        n_rows = len(records)
+        if out is None:
+            out = np.zeros((n_rows, self.n_features), dtype=FEATURE_DTYPE)
+        else:
+            out[...] = 0
+
+        unmatched = {}
+        for row, record in zip(out, records):
+            for column, value in record.items():
+                if not self._write(row, column, value):
+                    counts = unmatched.setdefault(column, {})
+                    counts[value] = counts.get(value, 0) + 1
+
+        return out, unmatched
+
+    def _encode_frame(self, frame, out):
+        n_rows = len(frame)
+        if out is None:
+            out = np.zeros((n_rows, self.n_features), dtype=FEATURE_DTYPE)
+        else:
+            out[...] = 0
+
+        unmatched = {}
+        for rows, positions, values in self._frame_entries(frame, unmatched):
+            out[rows, positions] = values
+        return out, unmatched
+
+    def _frame_entries(self, frame, unmatched):
+        """
+        Yield (rows, positions, values) arrays of the entries each column of
+        ``frame`` sets, in column order, recording misses in ``unmatched``.
+        """
+        import pandas as pd
+
+        n_rows = len(frame)
+        rows = np.arange(n_rows)
+        for column in frame.columns:
+            series = frame[column]
+            if pd.api.types.is_numeric_dtype(series.dtype):
+                # Whole column is numeric: pass through or drop, like reindex
+                position = self.numeric_index.get(self.aliases.get(column, column))
+                if position is not None:
+                    yield rows, np.full(n_rows, position), series.to_numpy(dtype=FEATURE_DTYPE)
+                else:
+                    unmatched[column] = series.value_counts(dropna=False).to_dict()
+                continue
+
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                # Reuse the existing codes; missing values (-1) get their own slot
+                uniques = [*series.cat.categories, None]
+                codes = np.array(series.cat.codes, dtype=np.intp)
+                codes[codes < 0] = len(uniques) - 1
+            else:
+                codes, uniques = pd.factorize(series.to_numpy(dtype=object), use_na_sentinel=False)
+            positions = np.full(len(uniques), -1, dtype=np.intp)
+            values = np.zeros(len(uniques), dtype=FEATURE_DTYPE)
+            for k, value in enumerate(uniques):
+                position = self.lookup(column, value)
+                if position is not None:
+                    positions[k] = position
+                    is_number = isinstance(value, (numbers.Number, np.bool_))
+                    values[k] = value if is_number else 1
+
+            row_positions = positions[codes]
+            hit = row_positions >= 0
+            yield rows[hit], row_positions[hit], values[codes[hit]]
+
+            if not hit.all():
+                missed = np.bincount(codes[~hit], minlength=len(uniques))
+                unmatched[column] = {uniques[k]: int(missed[k]) for k in np.flatnonzero(missed)}
+
+    def _record_entries(self, records, unmatched):
+        rows, positions, values = [], [], []
+        for i, record in enumerate(records):
+            for column, value in record.items():
+                position = self.lookup(column, value)
+                if position is None:
+                    counts = unmatched.setdefault(column, {})
+                    counts[value] = counts.get(value, 0) + 1
+                    continue
+                rows.append(i)
+                positions.append(position)
+                values.append(value if isinstance(value, (numbers.Number, np.bool_)) else 1)
+        yield np.array(rows, dtype=np.intp), np.array(positions, dtype=np.intp), np.array(values, dtype=FEATURE_DTYPE)
+
+    def _encode_sparse(self, records):
+        from scipy import sparse
+
+        unmatched = {}
+        if hasattr(records, "columns"):
+            entries = list(self._frame_entries(records, unmatched))
+        else:
+            entries = list(self._record_entries(records, unmatched))
+        n_rows = len(records)
+
+        if entries:
+            rows, positions, values = (np.concatenate(parts) for parts in zip(*entries))
+        else:
+            rows = positions = np.empty(0, dtype=np.intp)
+            values = np.empty(0, dtype=FEATURE_DTYPE)
+
+        # Where two inputs set the same cell the dense path keeps the later
+        # write; keep the last occurrence of each cell to match.
+        cells = rows * self.n_features + positions
+        _, last = np.unique(cells[::-1], return_index=True)
+        keep = len(cells) - 1 - last
+        keep = keep[values[keep] != 0]
+
+        matrix = sparse.csr_matrix(
+            (values[keep], (rows[keep], positions[keep])),
+            shape=(n_rows, self.n_features), dtype=FEATURE_DTYPE,
+        )
+        matrix.sort_indices()
+        return matrix, unmatched
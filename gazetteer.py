@@ -0,0 +1,288 @@
+"""
+Offline gazetteer of the places the model knows.
+
+``gazetteer.csv`` holds a lat/lon centroid for the CITY, COUNTY and COMMUNITY
+values in ``all_feature_names.pkl``, so the map can place them without a
+network round-trip. Names are also loaded into per-field prefix tries that
+back type-ahead completion in the app; every word start is indexed, so
+"northwest" completes to "Paradise Northwest A". ``Gazetteer.reverse``
+goes the other way, from GPS coordinates to the nearest known places,
+through per-field haversine ball trees over the centroids.
+
+The bundled centroids are approximate and incomplete: they cover all 11
+COUNTY, 65 of 70 CITY and 52 of 108 COMMUNITY categories. The rest are
+mostly subdivisions, parks and placeholder values ("Unknown", "Residential",
+single letters). ``locate`` falls back to the next broader place for them,
+and ``reverse`` never returns them. The names without a centroid are logged
+when the gazetteer is loaded and when it is rebuilt. The centroids can be
+regenerated from the DINS structure data (median LATITUDE/LONGITUDE per
+place) with:
+
+    python gazetteer.py csv_data/cali_wildfire_filled_address_df_with_community_topography_cleaned.csv
+"""
+import argparse
+import csv
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.csv")
+
+# Place fields, most specific first
+PLACE_FIELDS = ("COMMUNITY", "CITY", "COUNTY")
+
+# Rough California bounding box; DINS rows outside it are bad coordinates
+CALIFORNIA_BOUNDS = {"lat": (32.0, 42.1), "lon": (-124.6, -114.0)}
+
+# Key under which a trie node keeps the names that pass through it
+_MATCHES = ""
+
+EARTH_RADIUS_KM = 6371.0088
+# Farthest a centroid may be from a GPS fix and still name its place, in km
+REVERSE_MAX_KM = {"COMMUNITY": 10.0, "CITY": 15.0, "COUNTY": 80.0}
+
+
+def normalize_name(name):
+    """Return the lookup key for a place name: lower-cased and whitespace-collapsed."""
+    return " ".join(str(name or "").split()).lower()
+
+
+class PrefixIndex:
+    """
+    Trie over place names for type-ahead completion.
+
+    Every node keeps its completions pre-sorted, so a lookup is one walk down
+    the typed prefix. Names whose first word matches rank ahead of names where
+    a later word matches, then alphabetically.
+    """
+
+    def __init__(self, names):
+        self._root = {}
+        for name in set(names):
+            key = normalize_name(name)
+            for word in re.finditer(r"\w+", key):
+                self._insert(key[word.start():], (word.start() > 0, key, name))
+
+        # Sort and de-duplicate every node's matches once, up front
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if _MATCHES in node:
+                node[_MATCHES] = list(dict.fromkeys(name for _, _, name in sorted(node[_MATCHES])))
+            stack.extend(child for char, child in node.items() if char != _MATCHES)
+
+    def _insert(self, key, match):
+        node = self._root
+        for char in key:
+            node = node.setdefault(char, {})
+            node.setdefault(_MATCHES, []).append(match)
+
+    def complete(self, prefix, limit=8):
+        """Return up to ``limit`` names with a word starting with ``prefix``."""
+        node = self._root
+        for char in normalize_name(prefix):
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get(_MATCHES, [])[:limit]
+
+
+class NearestPlaceIndex:
+    """
+    Ball tree over place centroids with the haversine metric, for reverse geocoding.
+
+    Args:
+        places (list): (name, lat, lon) tuples.
+    """
+
+    def __init__(self, places):
+        from sklearn.neighbors import BallTree
+
+        self._names = [name for name, _, _ in places]
+        self._tree = BallTree(np.radians([(lat, lon) for _, lat, lon in places]), metric="haversine")
+
+    def nearest(self, lat, lon):
+        """Return ``(name, distance in km)`` of the closest place."""
+        distance, index = self._tree.query(np.radians([[lat, lon]]), k=1)
+        return self._names[int(index[0, 0])], float(distance[0, 0]) * EARTH_RADIUS_KM
+
+
+class Gazetteer:
+    """
+    Place centroids and completion indexes.
+
+    Args:
+        places (iterable): (field, name, lat, lon) rows.
+        known_names (dict, optional): Extra names per field to offer as
+            completions even without coordinates (e.g. every model category).
+            Those without coordinates are listed in ``unlocated``.
+    """
+
+    def __init__(self, places, known_names=None):
+        self._coordinates = {field: {} for field in PLACE_FIELDS}
+        self._located = {field: [] for field in PLACE_FIELDS}
+        names = {field: set((known_names or {}).get(field, ())) for field in PLACE_FIELDS}
+        for field, name, lat, lon in places:
+            self._coordinates[field][normalize_name(name)] = (float(lat), float(lon))
+            self._located[field].append((name, float(lat), float(lon)))
+            names[field].add(name)
+        self._indexes = {field: PrefixIndex(names[field]) for field in PLACE_FIELDS}
+        self.unlocated = {
+            field: sorted(name for name in (known_names or {}).get(field, ())
+                          if normalize_name(name) not in self._coordinates[field])
+            for field in PLACE_FIELDS
+        }
+        # Built on the first reverse lookup, so the app does not import scikit-learn up front
+        self._nearest = None
+        self._nearest_lock = threading.Lock()
+
+    def lookup(self, field, name):
+        """Return ``(lat, lon)`` for a CITY, COUNTY or COMMUNITY value, or None."""
+        return self._coordinates[field].get(normalize_name(name))
+
+    def locate(self, city, county, community):
+        """
+        Return ``(lat, lon)`` for the most specific known place, or None.
+
+        The community is tried first, then the city, then the county.
+        """
+        values = {"CITY": city, "COUNTY": county, "COMMUNITY": community}
+        for field in PLACE_FIELDS:
+            coordinates = self.lookup(field, values[field])
+            if coordinates is not None:
+                return coordinates
+        return None
+
+    def _nearest_indexes(self):
+        if self._nearest is None:
+            with self._nearest_lock:
+                if self._nearest is None:
+                    self._nearest = {field: NearestPlaceIndex(places)
+                                     for field, places in self._located.items() if places}
+        return self._nearest
+
+    def reverse(self, lat, lon, max_km=REVERSE_MAX_KM):
+        """
+        Return the nearest known place of each field to a GPS position.
+
+        Returns:
+            dict: {field: (name, distance in km)} for CITY, COUNTY and
+            COMMUNITY; a field is None when its closest centroid is farther
+            than ``max_km[field]``.
+        """
+        places = {field: None for field in PLACE_FIELDS}
+        for field, index in self._nearest_indexes().items():
+            name, distance = index.nearest(lat, lon)
+            if distance <= max_km[field]:
+                places[field] = (name, distance)
+        return places
+
+    def complete(self, field, prefix, limit=8):
+        """Return up to ``limit`` completions of ``prefix`` for a place field."""
+        if not normalize_name(prefix):
+            return []
+        return self._indexes[field].complete(prefix, limit)
+
+
+def read_places(path=GAZETTEER_PATH):
+    """Read (field, name, lat, lon) rows from a gazetteer CSV."""
+    with open(path, newline="") as file:
+        return [(row["kind"], row["name"], float(row["lat"]), float(row["lon"]))
+                for row in csv.DictReader(file)]
+
+
+def log_unlocated(unlocated, known_names, level=logging.INFO):
+    """Log the model places a gazetteer has no centroid for, per field."""
+    for field, names in unlocated.items():
+        if names:
+            logger.log(level, f"Gazetteer has no centroid for {len(names)} of {len(known_names.get(field, ()))} "
+                              f"{field} categories: {', '.join(names)}")
+
+
+def model_place_names(feature_names):
+    """Return the CITY/COUNTY/COMMUNITY categories present in the model's feature names."""
+    names = {field: [] for field in PLACE_FIELDS}
+    for feature in feature_names:
+        field, _, value = feature.partition("_")
+        if field in names:
+            names[field].append(value)
+    return names
+
+
+_default_gazetteer = None
+_default_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Return the process-wide gazetteer loaded from GAZETTEER_PATH, creating it on first use."""
+    global _default_gazetteer
+    if _default_gazetteer is None:
+        with _default_gazetteer_lock:
+            if _default_gazetteer is None:
+                from prediction import get_feature_names
+
+                known_names = model_place_names(get_feature_names())
+                gazetteer = Gazetteer(read_places(), known_names=known_names)
+                log_unlocated(gazetteer.unlocated, known_names)
+                _default_gazetteer = gazetteer
+    return _default_gazetteer
+
+
+def build_from_dins(dins_path, feature_names, output_path=GAZETTEER_PATH):
+    """
+    Write a gazetteer CSV of median structure coordinates per model place.
+
+    Args:
+        dins_path (str): Cleaned DINS CSV (or its Parquet conversion) with
+            CITY, COUNTY, COMMUNITY, LATITUDE and LONGITUDE columns.
+        feature_names (list): The model's feature names; only their places are kept.
+        output_path (str): Gazetteer CSV to write.
+
+    Returns:
+        int: Number of places written.
+    """
+    import ingest
+
+    df = ingest.read_columns(dins_path, [*PLACE_FIELDS, "LATITUDE", "LONGITUDE"])
+    df = df[df["LATITUDE"].between(*CALIFORNIA_BOUNDS["lat"])
+            & df["LONGITUDE"].between(*CALIFORNIA_BOUNDS["lon"])]
+
+    rows = []
+    known_names = model_place_names(feature_names)
+    for field, names in known_names.items():
+        centroids = df[df[field].isin(names)].groupby(field, observed=True)[["LATITUDE", "LONGITUDE"]].median()
+        for name, (lat, lon) in centroids.iterrows():
+            rows.append((field, name, round(lat, 4), round(lon, 4)))
+    located = {(field, normalize_name(name)) for field, name, _, _ in rows}
+    unlocated = {field: sorted(name for name in names if (field, normalize_name(name)) not in located)
+                 for field, names in known_names.items()}
+    log_unlocated(unlocated, known_names, logging.WARNING)
+
+    order = {field: i for i, field in enumerate(("COUNTY", "CITY", "COMMUNITY"))}
+    rows.sort(key=lambda row: (order[row[0]], row[1]))
+    with open(output_path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["kind", "name", "lat", "lon"])
+        writer.writerows(rows)
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the gazetteer from DINS structure data.")
+    parser.add_argument("dins_csv", help="cleaned DINS CSV or Parquet with LATITUDE/LONGITUDE columns")
+    parser.add_argument("--output", default=GAZETTEER_PATH, help="gazetteer CSV to write")
+    args = parser.parse_args(argv)
+
+    from prediction import get_feature_names
+
+    count = build_from_dins(args.dins_csv, get_feature_names(), args.output)
+    print(f"Wrote {count} places to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
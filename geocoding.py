@@ -0,0 +1,378 @@
+"""
+Geocoding for the risk map.
+
+Lookups go through a persistent SQLite store keyed on the normalized
+"city, county, community" string, with a TTL for found places and a shorter
+one for misses (negative caching). Concurrent lookups of the same key share a
+single upstream request, and every upstream request passes a rate limiter so
+we stay within Nominatim's one-request-per-second usage policy.
+
+Upstream calls use a pooled keep-alive session with connect/read timeouts and
+a few jittered retries. A circuit breaker stops calling an unhealthy upstream
+for a while, so callers fail fast (GeocoderUnavailable) instead of stalling.
+
+The upstream URL is configurable, so the geocoder can be pointed at a local
+stand-in HTTP server that speaks Nominatim's ``/search?format=jsonv2`` API.
+"""
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future
+
+import metrics
+from logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging():
+    """
+    Attach the queued console and JSON file handlers to the geocoding logger.
+
+    Lookups, misses and each retry are logged at INFO, which the
+    unconfigured logger would drop, and the circuit opening at WARNING.
+    Safe to call repeatedly.
+    """
+    setup_logging(__name__, 'geocoding.log')
+
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+USER_AGENT = "WildfirePredictionApp/1.0"
+
+GEOCODE_CACHE_PATH = os.environ.get(
+    "GEOCODE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "geocode_cache.sqlite"),
+)
+
+# Seconds a found / not-found answer is trusted
+FOUND_TTL = 30 * 24 * 3600
+NOT_FOUND_TTL = 24 * 3600
+
+# (connect, read) timeouts in seconds for one upstream attempt
+REQUEST_TIMEOUT = (2.0, 3.0)
+# Extra attempts after a timeout, connection error, 429 or 5xx
+MAX_RETRIES = 1
+# Base of the exponential backoff between attempts, in seconds
+RETRY_BACKOFF = 0.5
+
+# Consecutive failed lookups that open the circuit, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RESET_TIMEOUT = 60.0
+
+
+class GeocoderUnavailable(Exception):
+    """The upstream geocoder failed or is being skipped by the circuit breaker."""
+
+
+def normalize_location(city, county, community):
+    """Return the store key for a place: lower-cased, whitespace-collapsed "city, county, community"."""
+    parts = (" ".join(str(part or "").split()).lower() for part in (city, county, community))
+    return ", ".join(parts)
+
+
+class RateLimiter:
+    """Space calls at least ``min_interval`` seconds apart across threads."""
+
+    def __init__(self, min_interval=1.0):
+        self.min_interval = min_interval
+        self._next_allowed = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        # Reserve the next slot under the lock, then sleep outside it
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_allowed - now
+            self._next_allowed = max(now, self._next_allowed) + self.min_interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failures in a row the circuit opens and
+    ``allow()`` returns False for ``reset_timeout`` seconds. Then a single
+    trial call is let through (half-open): success closes the circuit, a
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_progress = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning("Geocoder circuit opened after repeated failures.")
+                self.opened_at = time.monotonic()
+
+
+class GeocodeStore:
+    """
+    SQLite-backed store of geocoding answers.
+
+    Rows hold the coordinates (NULL for places the geocoder did not find) and
+    an expiry time; expired rows are treated as absent.
+    """
+
+    def __init__(self, path):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS geocodes ("
+            "key TEXT PRIMARY KEY, lat REAL, lon REAL, expires_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return ``(found, (lat, lon) or None)`` for a fresh entry, or None when
+        there is no usable entry.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT lat, lon FROM geocodes WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        lat, lon = row
+        if lat is None:
+            return (False, None)
+        return (True, (lat, lon))
+
+    def put(self, key, coordinates, ttl):
+        lat, lon = coordinates if coordinates is not None else (None, None)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO geocodes (key, lat, lon, expires_at) VALUES (?, ?, ?, ?)",
+                (key, lat, lon, time.time() + ttl),
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class Geocoder:
+    """
+    Cached, coalescing, rate-limited geocoder.
+
+    Args:
+        store (GeocodeStore): Persistent answer store.
+        base_url (str): Nominatim-compatible search endpoint.
+        rate_limiter (RateLimiter, optional): Limiter in front of the upstream.
+        found_ttl (float): Seconds to trust a found place.
+        not_found_ttl (float): Seconds to trust a miss.
+        timeout (tuple): (connect, read) timeout per attempt, in seconds.
+        max_retries (int): Extra attempts after a retryable failure.
+        backoff (float): Base of the jittered exponential backoff, in seconds.
+        circuit_breaker (CircuitBreaker, optional): Breaker around the upstream.
+    """
+
+    def __init__(self, store, base_url=NOMINATIM_URL, rate_limiter=None,
+                 found_ttl=FOUND_TTL, not_found_ttl=NOT_FOUND_TTL,
+                 timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES, backoff=RETRY_BACKOFF,
+                 circuit_breaker=None):
+        self.store = store
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter or RateLimiter(1.0)
+        self.found_ttl = found_ttl
+        self.not_found_ttl = not_found_ttl
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self._session = None
+
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "upstream_requests": 0,
+                      "coalesced": 0, "retries": 0, "failures": 0, "short_circuited": 0}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+        metrics.increment("geocoder_events_total", event=name)
+
+    def _cached(self, key):
+        cached = self.store.get(key)
+        if cached is None:
+            return None
+        found, _ = cached
+        self._count("hits" if found else "negative_hits")
+        return cached
+
+    def geocode(self, city, county, community):
+        """
+        Return ``(lat, lon)`` for the place, or None when the geocoder does not know it.
+
+        Raises:
+            GeocoderUnavailable: When the upstream fails after retries or the
+                circuit breaker is open. Failures are not cached.
+        """
+        key = normalize_location(city, county, community)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached[1]
+
+        # Join an in-flight request for the same key, or become its owner
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.stats["coalesced"] += 1
+        if not owner:
+            metrics.increment("geocoder_events_total", event="coalesced")
+            return future.result()
+
+        try:
+            # Another owner may have finished between our lookup and now
+            cached = self._cached(key)
+            if cached is not None:
+                coordinates = cached[1]
+            else:
+                self._count("misses")
+                coordinates = self._fetch(city, county, community)
+                self.store.put(key, coordinates, self.found_ttl if coordinates else self.not_found_ttl)
+            future.set_result(coordinates)
+            return coordinates
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    @property
+    def session(self):
+        """Keep-alive session with a connection pool shared by all lookups."""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            # Retries are handled in _fetch so they can be jittered and rate limited
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=8, max_retries=0))
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=8, max_retries=0))
+            session.headers.update({
+                'User-Agent': USER_AGENT,
+                'Accept': 'application/json'
+            })
+            self._session = session
+        return self._session
+
+    def _fetch(self, city, county, community):
+        import requests
+
+        if not self.circuit_breaker.allow():
+            self._count("short_circuited")
+            raise GeocoderUnavailable("Geocoder circuit is open.")
+
+        location = f"{city}, {county}, {community}, California, USA"
+        url = f"{self.base_url}?q={urllib.parse.quote(location)}&format=jsonv2&limit=1"
+        logger.info(f"Geocoding location: {location}")
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                # Full jitter: sleep a random fraction of the exponential backoff
+                self._count("retries")
+                logger.info(f"Retrying geocoding for {location} (attempt {attempt + 1}) after: {error}")
+                time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+
+            self.rate_limiter.wait()
+            self._count("upstream_requests")
+            try:
+                with metrics.span("geocode_upstream"):
+                    response = self.session.get(url, timeout=self.timeout)
+                if response.status_code == 429 or response.status_code >= 500:
+                    error = GeocoderUnavailable(f"Geocoder returned HTTP {response.status_code}.")
+                    continue
+                response.raise_for_status()
+                data = response.json()
+                coordinates = (float(data[0]['lat']), float(data[0]['lon'])) if data else None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = GeocoderUnavailable(f"Geocoding request failed: {e}")
+                continue
+            except (requests.RequestException, ValueError, LookupError, TypeError) as e:
+                # Client errors and malformed bodies will not improve with a retry
+                error = GeocoderUnavailable(f"Geocoding request failed: {e}")
+                break
+
+            self.circuit_breaker.record_success()
+            if coordinates is None:
+                logger.info(f"No geocoding result for: {location}")
+            return coordinates
+
+        self._count("failures")
+        self.circuit_breaker.record_failure()
+        raise error
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+_default_geocoder = None
+_default_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    """Return the process-wide geocoder backed by GEOCODE_CACHE_PATH, creating it on first use."""
+    global _default_geocoder
+    if _default_geocoder is None:
+        with _default_geocoder_lock:
+            if _default_geocoder is None:
+                _default_geocoder = Geocoder(GeocodeStore(GEOCODE_CACHE_PATH))
+    return _default_geocoder
+
+
+def set_geocoder(geocoder):
+    """Replace the process-wide geocoder (e.g. with one pointed at a local server)."""
+    global _default_geocoder
+    with _default_geocoder_lock:
+        _default_geocoder = geocoder
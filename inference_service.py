@@ -0,0 +1,329 @@
+"""
+HTTP service for the wildfire risk model.
+
+Requests that arrive within a short window are collected into one block and
+scored with a single model call, so many small concurrent requests cost
+about as much as one batch. The queue of waiting rows is bounded; when it is
+full the service answers 503 with Retry-After instead of queueing more work.
+Records whose field values are not JSON scalars are rejected with 400 before
+they are queued, and a batch that still fails is retried one request at a
+time, so one bad request cannot fail the others batched with it.
+
+Endpoints:
+    POST /predict        one structure as a JSON object -> {"predicted_risk", "probabilities"}
+    POST /predict/batch  {"records": [...]} -> {"predictions": [...]}
+    POST /whatif         {"record": {...}, "limit": n, "fields": [...]} -> ranked mitigation variants
+    GET  /health         liveness
+    GET  /ready          200 once the model is loaded, 503 before
+    GET  /metrics        Prometheus text format
+
+Usage:
+    python inference_service.py --port 8000 --window-ms 5 --max-batch 256
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.web
+
+import metrics
+import mitigation
+import prediction
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for more requests after the first one of a batch arrives
+BATCH_WINDOW = 0.005
+# Most rows scored in one model call
+MAX_BATCH_SIZE = 256
+# Most rows waiting to be scored before new requests are turned away
+MAX_QUEUE_ROWS = 4096
+# Most records accepted in one /predict/batch request
+MAX_REQUEST_RECORDS = 1024
+
+# JSON values a field may hold; objects and arrays cannot be encoded
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+class QueueFull(Exception):
+    """The batcher has no room for more rows."""
+
+
+class MicroBatcher:
+    """
+    Collects concurrent scoring requests into stacked model calls.
+
+    Args:
+        window (float): Seconds to keep collecting after the first request.
+        max_batch_size (int): Most rows per model call.
+        max_queue_rows (int): Most rows waiting; more raise QueueFull.
+        executor (Executor, optional): Where model calls run, off the event loop.
+    """
+
+    def __init__(self, window=BATCH_WINDOW, max_batch_size=MAX_BATCH_SIZE,
+                 max_queue_rows=MAX_QUEUE_ROWS, executor=None):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_queue_rows = max_queue_rows
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+        self.queued_rows = 0
+        self.stats = {"requests": 0, "rows": 0, "batches": 0, "rejected": 0}
+
+        self._queue = asyncio.Queue()
+        self._worker = None
+
+    def start(self):
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, records):
+        """
+        Score ``records`` (list of dict) and return one result dict per record.
+
+        Raises:
+            QueueFull: When accepting the records would exceed max_queue_rows.
+        """
+        if self.queued_rows + len(records) > self.max_queue_rows:
+            self.stats["rejected"] += 1
+            metrics.increment("service_rejected_total")
+            raise QueueFull(f"{self.queued_rows} rows already waiting")
+
+        future = asyncio.get_running_loop().create_future()
+        self.queued_rows += len(records)
+        self.stats["requests"] += 1
+        self._queue.put_nowait((records, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Block for the first request, then keep collecting until the
+            # window closes or the batch is full
+            pending = [await self._queue.get()]
+            rows = len(pending[0][0])
+            deadline = loop.time() + self.window
+            while rows < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                rows += len(item[0])
+
+            records = [record for request_records, _ in pending for record in request_records]
+            self.queued_rows -= len(records)
+            try:
+                results = await loop.run_in_executor(self.executor, score_records, records)
+            except Exception as e:
+                logger.exception("Batch scoring failed.")
+                if len(pending) == 1:
+                    if not pending[0][1].done():
+                        pending[0][1].set_exception(e)
+                else:
+                    await self._score_separately(pending)
+                continue
+
+            self.stats["batches"] += 1
+            self.stats["rows"] += len(records)
+            metrics.increment("service_batches_total")
+            start = 0
+            for request_records, future in pending:
+                if not future.done():
+                    future.set_result(results[start:start + len(request_records)])
+                start += len(request_records)
+
+    async def _score_separately(self, pending):
+        # Retry a failed batch one request at a time, so a bad request only fails itself
+        loop = asyncio.get_running_loop()
+        for request_records, future in pending:
+            if future.done():
+                continue
+            try:
+                future.set_result(await loop.run_in_executor(self.executor, score_records, request_records))
+            except Exception as e:
+                future.set_exception(e)
+
+
+def non_scalar_fields(record):
+    """Return the fields of an input record whose values are JSON objects or arrays."""
+    return [field for field, value in record.items() if not isinstance(value, SCALAR_TYPES)]
+
+
+def score_records(records):
+    """Score a list of input dicts in one model call; results are shaped like predict_risk's."""
+    predicted_risk, probabilities, _ = prediction.predict_batch(records)
+    labels = [str(label) for label in prediction.get_class_names()]
+    return [
+        {"predicted_risk": str(risk), "probabilities": dict(zip(labels, row.tolist()))}
+        for risk, row in zip(predicted_risk, probabilities)
+    ]
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+
+    def write_json(self, payload, status=200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(payload))
+
+    def read_json(self):
+        try:
+            return json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Request body is not valid JSON")
+
+    def check_fields(self, record):
+        fields = non_scalar_fields(record)
+        if fields:
+            raise tornado.web.HTTPError(400, reason=f"Field values must be strings, numbers or null: {fields}")
+
+    async def score(self, records):
+        for record in records:
+            self.check_fields(record)
+        try:
+            return await self.service.batcher.submit(records)
+        except QueueFull:
+            self.set_header("Retry-After", "1")
+            raise tornado.web.HTTPError(503, reason="Inference queue is full")
+
+    def write_error(self, status_code, **kwargs):
+        self.write_json({"error": self._reason}, status=status_code)
+
+
+class PredictHandler(BaseHandler):
+    async def post(self):
+        record = self.read_json()
+        if not isinstance(record, dict):
+            raise tornado.web.HTTPError(400, reason="Expected a JSON object")
+        results = await self.score([record])
+        self.write_json(results[0])
+
+
+class PredictBatchHandler(BaseHandler):
+    async def post(self):
+        body = self.read_json()
+        records = body.get("records") if isinstance(body, dict) else None
+        if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+            raise tornado.web.HTTPError(400, reason='Expected {"records": [object, ...]}')
+        if len(records) > MAX_REQUEST_RECORDS:
+            raise tornado.web.HTTPError(413, reason=f"At most {MAX_REQUEST_RECORDS} records per request")
+        results = await self.score(records) if records else []
+        self.write_json({"predictions": results})
+
+
+class WhatIfHandler(BaseHandler):
+    async def post(self):
+        body = self.read_json()
+        record = body.get("record") if isinstance(body, dict) else None
+        if not isinstance(record, dict):
+            raise tornado.web.HTTPError(400, reason='Expected {"record": object}')
+        self.check_fields(record)
+        fields = body.get("fields", mitigation.MITIGATION_FIELDS)
+        if not isinstance(fields, list | tuple) or not all(f in mitigation.FIELD_OPTIONS for f in fields):
+            raise tornado.web.HTTPError(400, reason=f"fields must be a list of {sorted(mitigation.FIELD_OPTIONS)}")
+        limit = body.get("limit", mitigation.DEFAULT_LIMIT)
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+            raise tornado.web.HTTPError(400, reason="limit must be a positive integer")
+        # The sweep is one model call; it shares the model thread with the batcher
+        result = await asyncio.get_running_loop().run_in_executor(
+            self.service.batcher.executor, lambda: mitigation.sweep(record, fields=tuple(fields), limit=limit))
+        self.write_json(result)
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        self.write_json({"status": "ok", "uptime": time.monotonic() - self.service.started_at})
+
+
+class ReadyHandler(BaseHandler):
+    def get(self):
+        if not self.service.ready:
+            self.write_json({"status": "loading"}, status=503)
+            return
+        self.write_json({"status": "ready", "queued_rows": self.service.batcher.queued_rows,
+                         **self.service.batcher.stats})
+
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.finish(metrics.render_prometheus())
+
+
+class InferenceService:
+    """
+    The model service: a MicroBatcher plus the tornado application.
+
+    Args:
+        batcher (MicroBatcher, optional): Batcher to use; built with the defaults if omitted.
+    """
+
+    def __init__(self, batcher=None):
+        self.batcher = batcher or MicroBatcher()
+        self.ready = False
+        self.started_at = time.monotonic()
+        self.application = tornado.web.Application([
+            (r"/predict", PredictHandler, {"service": self}),
+            (r"/predict/batch", PredictBatchHandler, {"service": self}),
+            (r"/whatif", WhatIfHandler, {"service": self}),
+            (r"/health", HealthHandler, {"service": self}),
+            (r"/ready", ReadyHandler, {"service": self}),
+            (r"/metrics", MetricsHandler, {"service": self}),
+        ])
+
+    async def start(self, port, address="127.0.0.1"):
+        """Listen on ``port`` and load the model in the background; returns the HTTP server."""
+        server = self.application.listen(port, address)
+        self.batcher.start()
+        asyncio.get_running_loop().create_task(self._warm_up())
+        return server
+
+    async def _warm_up(self):
+        await asyncio.get_running_loop().run_in_executor(self.batcher.executor, prediction.warm_up)
+        self.ready = True
+        logger.info("Model loaded, service is ready.")
+
+
+async def serve(port, address, batcher):
+    service = InferenceService(batcher)
+    await service.start(port, address)
+    logger.info(f"Listening on http://{address}:{port}")
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the wildfire risk model over HTTP.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW * 1000,
+                        help="batching window in milliseconds (default: %(default)s)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH_SIZE, help="most rows per model call")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE_ROWS,
+                        help="most rows waiting before requests get 503")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    metrics.start_from_env()
+    batcher = MicroBatcher(window=args.window_ms / 1000, max_batch_size=args.max_batch,
+                           max_queue_rows=args.max_queue)
+    asyncio.run(serve(args.port, args.address, batcher))
+
+
+if __name__ == "__main__":
+    main()
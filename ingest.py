@@ -0,0 +1,254 @@
+"""
+Columnar ingest for the DINS structure data.
+
+``convert_csv`` turns a (possibly very large) DINS CSV into a directory of
+Parquet part files, one per chunk of rows, without holding the whole file in
+memory. Text columns are stored dictionary-encoded and come back as pandas
+categoricals, so high-cardinality columns such as CITY and COMMUNITY cost one
+small integer per row instead of one Python string. A ``_manifest.json`` in
+the directory records the source file, so an unchanged CSV is not converted
+twice.
+
+``read_columns`` loads only the requested columns from either format; the
+training pipeline, batch scoring and the gazetteer builder read through it.
+
+Usage:
+    python ingest.py csv_data/cali_wildfire_cleaned_with_feature_columns.csv \\
+        csv_data/cali_wildfire_cleaned_with_feature_columns.parquet
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+CHUNK_SIZE = 100_000
+MANIFEST_NAME = "_manifest.json"
+PART_TEMPLATE = "part-{:05d}.parquet"
+# Compression for the part files; zstd reads about as fast as snappy and is smaller
+COMPRESSION = "zstd"
+
+
+def is_parquet(path):
+    """True for a .parquet/.pq file or a directory of part files."""
+    return os.path.isdir(path) or path.endswith((".parquet", ".pq"))
+
+
+def source_fingerprint(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def dataset_fingerprint(path):
+    """Identify the contents of a CSV/Parquet file or a converted directory, for caching."""
+    if os.path.isdir(path):
+        return {"path": os.path.abspath(path), "parts": [
+            (name, os.path.getsize(part), os.stat(part).st_mtime_ns)
+            for name, part in ((name, os.path.join(path, name)) for name in _part_names(path))
+        ]}
+    return source_fingerprint(path)
+
+
+def _part_names(directory):
+    return sorted(name for name in os.listdir(directory)
+                  if name.endswith((".parquet", ".pq")) and not name.startswith(("_", ".")))
+
+
+def _dataset(path):
+    import pyarrow.dataset as ds
+
+    # Parts are listed explicitly so rows always come back in file order
+    if os.path.isdir(path):
+        path = [os.path.join(path, name) for name in _part_names(path)]
+    return ds.dataset(path, format="parquet")
+
+
+def read_manifest(output_dir):
+    """Return the manifest of a converted directory, or None."""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _arrow_schema(chunk):
+    """Schema for every part: text as dictionary<int32, string>, numbers as float64 or bool."""
+    import pandas as pd
+    import pyarrow as pa
+
+    fields = []
+    for column in chunk.columns:
+        dtype = chunk[column].dtype
+        if pd.api.types.is_bool_dtype(dtype):
+            arrow_type = pa.bool_()
+        elif pd.api.types.is_numeric_dtype(dtype):
+            # Integers become floats so a later chunk with blanks still fits
+            arrow_type = pa.float64()
+        else:
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        fields.append(pa.field(column, arrow_type))
+    return pa.schema(fields)
+
+
+def _pandas_dtypes(schema):
+    import pyarrow as pa
+
+    return {field.name: (str if pa.types.is_dictionary(field.type) else
+                         "boolean" if pa.types.is_boolean(field.type) else "float64")
+            for field in schema}
+
+
+def convert_csv(csv_path, output_dir, chunk_size=CHUNK_SIZE, force=False, log=sys.stderr):
+    """
+    Convert a CSV to a directory of Parquet part files, ``chunk_size`` rows at a time.
+
+    Column types are inferred from the first chunk and then fixed, so every
+    part shares one schema. A column inferred as numeric that later holds
+    text fails the conversion with pandas' ValueError.
+
+    Args:
+        csv_path (str): The source CSV.
+        output_dir (str): Directory to (re)create.
+        chunk_size (int): Rows read, converted and written per part.
+        force (bool): Convert even when the manifest says the output is current.
+        log (file): Where progress lines are printed.
+
+    Returns:
+        dict: The manifest (source, rows, parts, columns, seconds).
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    source = source_fingerprint(csv_path)
+    manifest = read_manifest(output_dir)
+    if not force and manifest is not None and manifest["source"] == source:
+        print(f"{output_dir} is up to date with {csv_path}.", file=log)
+        return manifest
+
+    # Write next to the target and swap in at the end, so readers never see a partial dataset
+    tmp_dir = output_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    started = time.perf_counter()
+    # Every chunk is parsed with the types inferred from the first one
+    schema = _arrow_schema(pd.read_csv(csv_path, nrows=chunk_size, low_memory=False))
+    dtypes = _pandas_dtypes(schema)
+    rows, parts = 0, 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size, dtype=dtypes):
+        chunk = chunk.astype({column: "category" for column, dtype in dtypes.items() if dtype is str})
+        table = pa.Table.from_pandas(chunk, preserve_index=False).cast(schema)
+        pq.write_table(table, os.path.join(tmp_dir, PART_TEMPLATE.format(parts)), compression=COMPRESSION)
+        rows += len(chunk)
+        parts += 1
+        print(f"part {parts}: {rows} rows", file=log)
+
+    manifest = {
+        "source": source,
+        "rows": rows,
+        "parts": parts,
+        "chunk_size": chunk_size,
+        "columns": {field.name: str(field.type) for field in schema},
+        "seconds": time.perf_counter() - started,
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file, indent=2)
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    return manifest
+
+
+def read_columns(path, columns=None, dtype=None):
+    """
+    Load ``columns`` from a CSV, a Parquet file or a converted directory.
+
+    Parquet text columns come back as categoricals with sorted categories,
+    the order ``pd.get_dummies`` and ``FeatureEncoder.from_frame`` use for
+    plain text columns, so either source encodes to the same features. With
+    ``dtype=str``, Parquet's numeric and boolean columns are turned back into
+    the text ``read_csv`` would give (1975.0 as "1975", blanks stay missing),
+    so YEARBUILT is one-hot encoded from either source.
+
+    Args:
+        path (str): CSV file, Parquet file or directory written by convert_csv.
+        columns (list, optional): Columns to load; all when omitted.
+        dtype: Passed to ``pd.read_csv`` for CSV input; ``str`` also applies
+            to Parquet input, as above.
+
+    Returns:
+        pd.DataFrame: The requested columns, in the requested order.
+    """
+    import pandas as pd
+
+    if not is_parquet(path):
+        frame = pd.read_csv(path, usecols=columns, dtype=dtype)
+        return frame if columns is None else frame[list(columns)]
+
+    frame = _dataset(path).to_table(columns=columns).to_pandas()
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.CategoricalDtype):
+            frame[column] = frame[column].cat.reorder_categories(sorted(frame[column].cat.categories))
+        elif dtype is str:
+            frame[column] = _as_csv_text(frame[column])
+    return frame
+
+
+def _as_csv_text(series):
+    """Format a numeric or boolean column as the strings read_csv(dtype=str) returns."""
+    def text(value):
+        if isinstance(value, float) and value.is_integer():
+            # convert_csv stores integer columns as float64
+            return str(int(value))
+        return str(value)
+
+    return series.astype(object).where(series.notna()).map(text, na_action="ignore")
+
+
+def iter_batches(path, columns, batch_size, skip_rows=0, dtype=None):
+    """
+    Yield DataFrames of at most ``batch_size`` rows of ``columns`` from Parquet input.
+
+    Columns missing from the data are skipped. ``skip_rows`` leading rows are
+    dropped (used when resuming). With ``dtype=str``, numeric and boolean
+    columns are turned into text as by read_columns.
+    """
+    import pandas as pd
+
+    dataset = _dataset(path)
+    available = [c for c in columns if c in dataset.schema.names]
+    for batch in dataset.to_batches(columns=available, batch_size=batch_size):
+        if skip_rows >= batch.num_rows:
+            skip_rows -= batch.num_rows
+            continue
+        if skip_rows:
+            batch = batch.slice(skip_rows)
+            skip_rows = 0
+        frame = batch.to_pandas()
+        if dtype is str:
+            for column in frame.columns:
+                if not isinstance(frame[column].dtype, pd.CategoricalDtype):
+                    frame[column] = _as_csv_text(frame[column])
+        yield frame
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a DINS CSV to chunked, dictionary-encoded Parquet.")
+    parser.add_argument("csv", help="source CSV")
+    parser.add_argument("output", nargs="?", help="output directory (default: the CSV path with .parquet)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="rows per part file (default: %(default)s)")
+    parser.add_argument("--force", action="store_true", help="convert even if the output is up to date")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.splitext(args.csv)[0] + ".parquet"
+    manifest = convert_csv(args.csv, output, chunk_size=args.chunk_size, force=args.force)
+    size = sum(os.path.getsize(os.path.join(output, name)) for name in os.listdir(output))
+    print(f"{manifest['rows']} rows in {manifest['parts']} parts, {size / 2**20:.1f} MiB "
+          f"(CSV {os.path.getsize(args.csv) / 2**20:.1f} MiB) -> {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Live-location risk tracking.
+
+GPS fixes arrive far more often than anything worth recomputing changes.
+``LocationThrottle`` lets a fix through only after the device has moved
+``min_distance_m`` and ``min_interval_s`` has passed since the last accepted
+one. ``LiveTracker`` reverse-geocodes accepted fixes to the nearest known
+COMMUNITY, CITY and COUNTY with the gazetteer's haversine ball trees, and
+re-runs the model only when that place changes; the structure fields come
+from the profile the tracker was created with.
+
+Used by Feature_Test_Files/UserLiveLocationTracking.py:
+    tracker = LiveTracker(structure)
+    update = tracker.update(lat, lon)   # None while throttled
+"""
+import os
+import time
+
+import numpy as np
+
+import metrics
+from gazetteer import EARTH_RADIUS_KM, PLACE_FIELDS, get_gazetteer
+
+# Movement and time an update needs before the place and prediction are recomputed
+MIN_DISTANCE_M = float(os.environ.get("LIVE_MIN_DISTANCE_M", 100.0))
+MIN_INTERVAL_S = float(os.environ.get("LIVE_MIN_INTERVAL_S", 5.0))
+# Fixes reported less accurate than this (metres) are ignored
+MAX_ACCURACY_M = float(os.environ.get("LIVE_MAX_ACCURACY_M", 1000.0))
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres between two points given in degrees."""
+    lat1, lon1, lat2, lon2 = np.radians([lat1, lon1, lat2, lon2])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return float(2 * EARTH_RADIUS_KM * 1000 * np.arcsin(np.sqrt(a)))
+
+
+class LocationThrottle:
+    """
+    Debounce position updates by distance and time.
+
+    Args:
+        min_distance_m (float): Movement from the last accepted fix needed to accept a new one.
+        min_interval_s (float): Seconds since the last accepted fix needed to accept a new one.
+        max_accuracy_m (float): Fixes with a worse reported accuracy are dropped.
+    """
+
+    def __init__(self, min_distance_m=MIN_DISTANCE_M, min_interval_s=MIN_INTERVAL_S,
+                 max_accuracy_m=MAX_ACCURACY_M):
+        self.min_distance_m = min_distance_m
+        self.min_interval_s = min_interval_s
+        self.max_accuracy_m = max_accuracy_m
+        self.last = None
+        self.accepted = 0
+        self.dropped = 0
+
+    def accept(self, lat, lon, now=None, accuracy=None):
+        """Return True (and remember the fix) when it is a meaningful move."""
+        now = time.monotonic() if now is None else now
+        if accuracy is not None and accuracy > self.max_accuracy_m:
+            ok = False
+        elif self.last is None:
+            ok = True
+        else:
+            last_lat, last_lon, last_time = self.last
+            ok = (now - last_time >= self.min_interval_s
+                  and haversine_m(last_lat, last_lon, lat, lon) >= self.min_distance_m)
+        if ok:
+            self.last = (lat, lon, now)
+            self.accepted += 1
+        else:
+            self.dropped += 1
+        return ok
+
+    def reset(self):
+        self.last = None
+
+
+class LiveTracker:
+    """
+    Track the risk of a structure profile at a moving position.
+
+    Args:
+        structure (dict): Non-place input fields (roof, eaves, ...) used for every prediction.
+        throttle (LocationThrottle, optional): Debounce settings; the defaults when omitted.
+        gazetteer (Gazetteer, optional): Places to reverse-geocode against.
+    """
+
+    def __init__(self, structure, throttle=None, gazetteer=None):
+        self.structure = {field: value for field, value in structure.items() if field not in PLACE_FIELDS}
+        self.throttle = throttle or LocationThrottle()
+        self.gazetteer = gazetteer or get_gazetteer()
+        self.place = None
+        self.prediction = None
+        self.predictions = 0
+
+    def set_structure(self, structure):
+        """Switch to another structure profile; the next fix is scored right away."""
+        structure = {field: value for field, value in structure.items() if field not in PLACE_FIELDS}
+        if structure != self.structure:
+            self.structure = structure
+            self.place = None
+            self.throttle.reset()
+
+    def update(self, lat, lon, now=None, accuracy=None):
+        """
+        Feed one GPS fix.
+
+        Returns:
+            dict or None: None while the throttle holds the update back.
+            Otherwise ``lat``, ``lon``, ``places`` ({field: (name, km) or
+            None}), ``prediction`` (predict_risk output) and
+            ``place_changed`` (whether the model was re-run).
+        """
+        if not self.throttle.accept(lat, lon, now, accuracy):
+            metrics.increment("live_updates_total", outcome="throttled")
+            return None
+
+        from prediction import predict_risk
+
+        with metrics.span("reverse_geocode"):
+            places = self.gazetteer.reverse(lat, lon)
+        place = tuple(None if places[field] is None else places[field][0] for field in PLACE_FIELDS)
+        place_changed = place != self.place
+        if place_changed:
+            self.place = place
+            self.prediction = predict_risk({**self.structure, **dict(zip(PLACE_FIELDS, place))})
+            self.predictions += 1
+        metrics.increment("live_updates_total", outcome="predicted" if place_changed else "moved")
+        return {
+            "lat": lat,
+            "lon": lon,
+            "places": places,
+            "prediction": self.prediction,
+            "place_changed": place_changed,
+        }
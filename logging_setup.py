@@ -0,0 +1,168 @@
+"""
+Shared, non-blocking logging setup.
+
+``setup_logging(name, log_file)`` configures a logger once per process. The
+logger itself only puts records on an in-memory queue; a background
+QueueListener formats them and writes them to the console (human-readable)
+and to a log file (one JSON object per line). Files rotate at midnight and
+whenever they grow past LOG_MAX_BYTES, whichever comes first.
+
+High-volume events can be sampled at the source by logging them with
+``extra=sampled(rate)``: only about ``rate`` of those records are queued.
+Warnings and errors are never sampled.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+LOG_DIR = os.environ.get("LOG_DIR", "logs")
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", 7))
+LOG_ROTATE_WHEN = os.environ.get("LOG_ROTATE_WHEN", "midnight")
+
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed in ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_configured = {}
+_listeners = []
+_lock = threading.Lock()
+
+
+def sampled(rate):
+    """Return ``extra`` for a record that should be kept with probability ``rate``."""
+    return {"sample_rate": rate}
+
+
+class SizeAndTimeRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Rotate on the TimedRotatingFileHandler schedule and also when the file exceeds ``max_bytes``."""
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, when=LOG_ROTATE_WHEN,
+                 backup_count=LOG_BACKUP_COUNT, encoding="utf-8"):
+        super().__init__(filename, when=when, backupCount=backup_count, encoding=encoding, delay=True)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes <= 0:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        return self.stream.tell() >= self.max_bytes
+
+    def rotation_filename(self, default_name):
+        # Size rollovers can happen several times in one period; keep each file
+        name = super().rotation_filename(default_name)
+        candidate, count = name, 0
+        while os.path.exists(candidate):
+            count += 1
+            candidate = f"{name}.{count}"
+        return candidate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any fields passed via ``extra``."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "sample_rate":
+                entry[key] = value
+        if record.exc_info or record.exc_text:
+            entry["exception"] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep every ``1 / sample_rate``-th record of each sampled message; pass everything else."""
+
+    def __init__(self):
+        super().__init__()
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        rate = getattr(record, "sample_rate", None)
+        if rate is None or rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count % max(1, round(1 / rate)) == 0
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Leave message formatting to the listener thread; only capture the
+        # traceback text now, while the exception is still current.
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+
+def _stop_listeners():
+    for listener in _listeners:
+        listener.stop()
+    _listeners.clear()
+
+
+def setup_logging(name, log_file=None, level=logging.INFO, console=True):
+    """
+    Configure the logger ``name`` once and return it.
+
+    Args:
+        name (str): Logger name, usually ``__name__``.
+        log_file (str, optional): File name under LOG_DIR for JSON records.
+        level (int): Logger level.
+        console (bool): Also write human-readable lines to stderr.
+
+    Returns:
+        logging.Logger: The configured logger. Later calls return it unchanged.
+    """
+    logger = logging.getLogger(name)
+    if name in _configured:
+        return logger
+    with _lock:
+        if name in _configured:
+            return logger
+
+        handlers = []
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+            handlers.append(console_handler)
+        if log_file:
+            try:
+                os.makedirs(LOG_DIR, exist_ok=True)
+                file_handler = SizeAndTimeRotatingFileHandler(os.path.join(LOG_DIR, log_file))
+                file_handler.setFormatter(JsonFormatter())
+                handlers.append(file_handler)
+            except OSError as e:
+                logger.warning(f"Could not set up file logging: {e}")
+
+        record_queue = queue.SimpleQueue()
+        queue_handler = _QueueHandler(record_queue)
+        queue_handler.addFilter(SamplingFilter())
+        listener = logging.handlers.QueueListener(record_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        if not _listeners:
+            atexit.register(_stop_listeners)
+        _listeners.append(listener)
+
+        logger.addHandler(queue_handler)
+        logger.setLevel(level)
+        logger.propagate = False
+        _configured[name] = logger
+        return logger
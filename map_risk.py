@@ -1,120 +1,238 @@
-import plotly.express as px
-import pandas as pd
-import requests
-import urllib.parse
 import logging
-import os 
-
-log_dir = 'logs'
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()  # Always log to console
-    ]
-)
-
-# Add file handler after creating directory
+import time
+
+import numpy as np
+
+import metrics
+from gazetteer import PLACE_FIELDS, get_gazetteer
+from logging_setup import sampled, setup_logging
+from risk_atlas import DEFAULT_PROFILE, get_atlas
+
+# Butte County, California; shown when a place cannot be located
+FALLBACK_LAT, FALLBACK_LON = 39.7233, -121.9026
+
+# Heat-map defaults: grid half-width in km, points per side and falloff kernel
+HEATMAP_EXTENT_KM = 5.0
+HEATMAP_RESOLUTION = 11
+HEATMAP_KERNEL = "linear"
+# Spread of the gaussian kernel, in units of the extent
+GAUSSIAN_SIGMA = 0.4
+
+MAP_ZOOM = 14
+# Statewide atlas view: centre of California and the zoom that fits it
+ATLAS_CENTER = (37.2, -119.5)
+ATLAS_ZOOM = 4.6
+KM_PER_DEGREE_LAT = 110.574
+
+# Share of routine per-map log lines that are kept
+MAP_LOG_SAMPLE_RATE = 0.1
+
 logger = logging.getLogger(__name__)
-try:
-    file_handler = logging.FileHandler(os.path.join(log_dir, 'Logwildfire_map.log'))
-    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    logger.addHandler(file_handler)
-except Exception as e:
-    logger.warning(f"Could not set up file logging: {e}")
-
-def create_map(city, county, community, risk_probabilities):
+
+
+def configure_logging():
+    """
+    Attach the queued console and JSON file handlers used by the map module.
+
+    Called on first use instead of at import time, so importing map_risk does
+    not touch the filesystem or the root logger. Safe to call repeatedly.
+    """
+    setup_logging(__name__, 'Logwildfire_map.log')
+
+
+def warm_up():
+    """Import the plotting and HTTP libraries and load the gazetteer ahead of the first map request."""
+    configure_logging()
+    import plotly.graph_objects  # noqa: F401
+    get_gazetteer()
+    get_atlas()
+    from geocoding import get_geocoder
+
+    get_geocoder().session
+
+def resolve_location(city, county, community):
+    """
+    Locate a place for the map.
+
+    Places the model knows are answered from the offline gazetteer; only
+    other places go to the network geocoder.
+
+    Returns:
+        tuple: (lat, lon, approximate). ``approximate`` is True when the place
+        could not be geocoded (unknown place, upstream failure or open circuit)
+        and the Butte County fallback coordinates are returned instead.
+    """
+    coordinates = get_gazetteer().locate(city, county, community)
+    if coordinates is not None:
+        metrics.increment("location_source_total", source="gazetteer")
+        lat, lon = coordinates
+        return lat, lon, False
+
+    # Only places the gazetteer lacks need the network geocoder and its HTTP stack
+    from geocoding import GeocoderUnavailable, get_geocoder
+
     try:
-        logger.info("Starting map creation process.")
-        # Geocode the location
-        location = f"{city}, {county}, {community}, California, USA"
-        logger.info(f"Geocoding location: {location}")
-        encoded_location = urllib.parse.quote(location)
-        
-        headers = {
-            'User-Agent': 'WildfirePredictionApp/1.0',
-            'Accept': 'application/json'
-        }
-        
-        url = f"https://nominatim.openstreetmap.org/search?q={encoded_location}&format=jsonv2&limit=1"
-        logger.info(f"Making request to: {url}")
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        data = response.json()
-        logger.info(f"Geocoding response: {data}")
-        
-        if data and len(data) > 0:
-            lat = float(data[0].get('lat', 39.7233))
-            lon = float(data[0].get('lon', -121.9026))
-        else:
-            lat, lon = 39.7233, -121.9026  # California Butte
-            logger.warning("Fallback to default coordinates (Butte, California).")
-            
-        # Create a grid of points around the location for the heatmap
-        radius = 50  # Approximately 5km radius
-        points = []
-        
+        with metrics.span("geocode"):
+            coordinates = get_geocoder().geocode(city, county, community)
+    except GeocoderUnavailable as e:
+        logger.error(f"Error in geocoding request: {e}")
+        coordinates = None
+
+    if coordinates is None:
+        metrics.increment("location_source_total", source="fallback")
+        logger.warning("Fallback to default coordinates (Butte, California).")
+        return FALLBACK_LAT, FALLBACK_LON, True
+    metrics.increment("location_source_total", source="geocoder")
+    lat, lon = coordinates
+    return lat, lon, False
+
+def _linear_kernel(u, v):
+    # Falls off with the grid-step distance, as the original 11x11 map did
+    return 1 - (np.abs(u) + np.abs(v)) / 2
+
+
+def _cone_kernel(u, v):
+    return np.clip(1 - np.hypot(u, v), 0, None)
+
+
+def _gaussian_kernel(u, v):
+    return np.exp(-(u ** 2 + v ** 2) / (2 * GAUSSIAN_SIGMA ** 2))
+
+
+def _uniform_kernel(u, v):
+    return np.ones(np.broadcast_shapes(u.shape, v.shape))
+
+
+# Intensity falloff over the grid, as a function of the offset from the
+# centre in units of the extent (-1..1 on each axis)
+KERNELS = {
+    "linear": _linear_kernel,
+    "cone": _cone_kernel,
+    "gaussian": _gaussian_kernel,
+    "uniform": _uniform_kernel,
+}
+
+
+def heatmap_grid(lat, lon, peak, extent_km=HEATMAP_EXTENT_KM, resolution=HEATMAP_RESOLUTION,
+                 kernel=HEATMAP_KERNEL):
+    """
+    Build the heat-map grid around a location.
+
+    Args:
+        lat (float): Latitude of the centre.
+        lon (float): Longitude of the centre.
+        peak (float): Intensity at the centre.
+        extent_km (float): Distance from the centre to the grid edge, in km.
+        resolution (int): Points per side of the square grid.
+        kernel (str): Falloff kernel, one of KERNELS.
+
+    Returns:
+        tuple: Flat (lats, lons, intensities) arrays of resolution**2 points.
+    """
+    if kernel not in KERNELS:
+        raise ValueError(f"Unknown heat-map kernel {kernel!r}; expected one of {sorted(KERNELS)}")
+    if resolution < 2:
+        raise ValueError("Heat-map resolution must be at least 2 points per side.")
+
+    steps = np.linspace(-1.0, 1.0, resolution)
+    v, u = np.meshgrid(steps, steps, indexing="ij")
+
+    # A degree of longitude shrinks with the cosine of the latitude
+    lat_step = extent_km / KM_PER_DEGREE_LAT
+    lon_step = extent_km / (KM_PER_DEGREE_LAT * np.cos(np.radians(lat)))
+
+    lats = lat + v.ravel() * lat_step
+    lons = lon + u.ravel() * lon_step
+    intensities = peak * KERNELS[kernel](u, v).ravel()
+    return lats, lons, intensities
+
+
+def point_radius(lat, extent_km, resolution, zoom):
+    """Return a density radius in pixels that blends neighbouring grid points at this zoom."""
+    metres_per_pixel = 156543.03 * np.cos(np.radians(lat)) / 2 ** zoom
+    spacing = 2 * extent_km * 1000 / (resolution - 1)
+    return max(1, int(round(1.5 * spacing / metres_per_pixel)))
+
+
+def create_map(city, county, community, risk_probabilities, extent_km=HEATMAP_EXTENT_KM,
+               resolution=HEATMAP_RESOLUTION, kernel=HEATMAP_KERNEL, location=None):
+    """
+    Build the risk heat-map for a place.
+
+    Args:
+        city (str): City entered by the user.
+        county (str): County entered by the user.
+        community (str): Community entered by the user.
+        risk_probabilities (dict): Class probabilities from predict_risk.
+        extent_km (float): Distance from the place to the edge of the heat-map, in km.
+        resolution (int): Heat-map points per side.
+        kernel (str): Intensity falloff, one of KERNELS.
+        location (tuple, optional): (lat, lon, approximate) from an earlier
+            resolve_location call; the place is resolved here when omitted.
+
+    Returns:
+        plotly.graph_objects.Figure or None: The map, or None if it could not be built.
+    """
+    # Heavy imports are deferred so importing this module stays cheap
+    import plotly.graph_objects as go
+
+    configure_logging()
+    try:
+        logger.info("Starting map creation process.", extra=sampled(MAP_LOG_SAMPLE_RATE))
+        # Geocode the location; never blocks past the geocoder's timeouts
+        if location is None:
+            location = resolve_location(city, county, community)
+        lat, lon, approximate = location
+
         # Get the highest risk probability to determine intensity
         max_prob = max(risk_probabilities.values())
-        logger.info(f"Max risk probability: {max_prob}")
-        
-        # Generate points in a grid pattern around the location
-        for i in range(-5, 6):
-            for j in range(-5, 6):
-                points.append({
-                    'lat': lat + (i * radius / 5),
-                    'lon': lon + (j * radius / 5),
-                    'intensity': max_prob * (1 - (abs(i) / 5 + abs(j) / 5) / 2)  # Decrease intensity with distance
-                })
-        
-        df = pd.DataFrame(points)
-        logger.info("Generated points for heatmap grid.")
-
-        # Create the map with both scatter and density layers
-        fig = px.density_mapbox(
-            df,
-            lat='lat',
-            lon='lon',
-            z='intensity',
-            radius=200,
-            center=dict(lat=lat, lon=lon),
-            zoom=14,
-            mapbox_style="open-street-map",
+        logger.info("Max risk probability: %s", max_prob, extra=sampled(MAP_LOG_SAMPLE_RATE))
+
+        with metrics.span("heatmap_grid"):
+            lats, lons, intensities = heatmap_grid(lat, lon, max_prob, extent_km, resolution, kernel)
+        logger.info("Generated %d points for heatmap grid.", len(lats), extra=sampled(MAP_LOG_SAMPLE_RATE))
+
+        figure_started = time.perf_counter()
+        fig = go.Figure(go.Densitymapbox(
+            lat=lats,
+            lon=lons,
+            z=intensities,
+            radius=point_radius(lat, extent_km, resolution, MAP_ZOOM),
             opacity=0.8,
-            color_continuous_scale=["green", "yellow", "red"]
-        )
-        
+            coloraxis="coloraxis",
+            name="Risk",
+        ))
+
         # Add a marker for the exact location
         fig.add_scattermapbox(
             lat=[lat],
             lon=[lon],
             mode='markers',
             marker=dict(size=10, color='red'),
-            name='Location'
+            name='Approximate location (Butte County)' if approximate else 'Location'
         )
-        
+
         fig.update_layout(
             margin=dict(l=0, r=0, t=0, b=0),
             mapbox=dict(
+                style="open-street-map",
                 center=dict(lat=lat, lon=lon),
-                zoom=14
-            )
+                zoom=MAP_ZOOM
+            ),
+            coloraxis=dict(colorscale=["green", "yellow", "red"]),
+            meta={"approximate_location": approximate}
         )
-        logger.info("Map successfully created.")
+        if approximate:
+            fig.add_annotation(
+                text="Approximate location: place could not be found",
+                x=0.01, y=0.99, xref="paper", yref="paper",
+                xanchor="left", yanchor="top", showarrow=False,
+                bgcolor="rgba(255, 255, 255, 0.8)"
+            )
+        metrics.observe("map_figure", time.perf_counter() - figure_started)
+        logger.info("Map successfully created.", extra=sampled(MAP_LOG_SAMPLE_RATE))
         return fig
 
-    except requests.RequestException as e:
-        logger.error(f"Error in geocoding request: {e}")
-        # Fallback to California center coordinates
-        lat, lon = 39.7233, -121.9026
-        logger.info("Using fallback coordinates for map creation.")
-        return None
-
     except ValueError as e:
         logger.error(f"ValueError during map creation: {e}")
         return None
@@ -122,3 +240,65 @@ def create_map(city, county, community, risk_probabilities):
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         return None
+
+
+def atlas_trace(atlas, profile=DEFAULT_PROFILE, rows=None):
+    """
+    Build a marker trace of precomputed place risk from the atlas.
+
+    Args:
+        atlas (RiskAtlas): The precomputed table.
+        profile (str): Building profile to show.
+        rows (np.ndarray, optional): Places to include (e.g. from atlas.within); all by default.
+
+    Returns:
+        plotly.graph_objects.Scattermapbox: One marker per place, coloured by
+        the probability of major damage or destruction.
+    """
+    import plotly.graph_objects as go
+
+    if rows is None:
+        rows = np.arange(len(atlas))
+    severity = atlas.severity(profile)[rows]
+    return go.Scattermapbox(
+        lat=atlas.lats[rows],
+        lon=atlas.lons[rows],
+        mode="markers",
+        marker=dict(size=9, color=severity, coloraxis="coloraxis", opacity=0.85),
+        text=[f"{name} ({field.title()})<br>Major or destroyed: {value:.0%}"
+              for name, field, value in zip(atlas.names[rows], np.array(PLACE_FIELDS)[atlas.fields[rows]], severity)],
+        hoverinfo="text",
+        name=f"Known places ({profile} building)",
+    )
+
+
+def create_atlas_map(location=None, profile=DEFAULT_PROFILE, atlas=None):
+    """
+    Build the statewide map of precomputed risk for every known place.
+
+    Args:
+        location (tuple, optional): (lat, lon, approximate) of the user's place, marked on the map.
+        profile (str): Building profile to show.
+        atlas (RiskAtlas, optional): Defaults to the one at risk_atlas.ATLAS_PATH.
+
+    Returns:
+        plotly.graph_objects.Figure or None: The map, or None when no atlas has been built.
+    """
+    import plotly.graph_objects as go
+
+    atlas = atlas or get_atlas()
+    if atlas is None:
+        return None
+    with metrics.span("atlas_map"):
+        fig = go.Figure(atlas_trace(atlas, profile))
+        if location is not None and not location[2]:
+            fig.add_scattermapbox(lat=[location[0]], lon=[location[1]], mode="markers",
+                                  marker=dict(size=12, color="black"), name="Location")
+        fig.update_layout(
+            margin=dict(l=0, r=0, t=0, b=0),
+            mapbox=dict(style="open-street-map", center=dict(lat=ATLAS_CENTER[0], lon=ATLAS_CENTER[1]),
+                        zoom=ATLAS_ZOOM),
+            coloraxis=dict(colorscale=["green", "yellow", "red"], cmin=0, cmax=1,
+                           colorbar=dict(title="Major or<br>destroyed", tickformat=".0%")),
+        )
+    return fig
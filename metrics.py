@@ -0,0 +1,264 @@
+"""
+In-process metrics: stage timings and counters.
+
+``span("encode")`` times a block into the ``wildfire_stage_duration_seconds``
+histogram and ``increment(name, **labels)`` bumps a counter. Both are a
+dictionary lookup and a short locked update, and become no-ops when metrics
+are disabled (``METRICS_ENABLED=0`` or ``disable()``).
+
+Metrics can be read as Prometheus text (``render_prometheus``, served by
+``start_http_server`` and by the inference service's /metrics) or as a JSON
+snapshot (``snapshot``, written periodically by ``start_snapshot_writer``).
+``start_from_env`` starts whichever exporters METRICS_PORT and
+METRICS_SNAPSHOT_PATH ask for.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "wildfire_"
+STAGE_HISTOGRAM = "stage_duration_seconds"
+
+# Histogram bucket upper bounds in seconds, from cache hits to network calls
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SNAPSHOT_INTERVAL = float(os.environ.get("METRICS_SNAPSHOT_INTERVAL", 60))
+
+_enabled = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+_NOOP_SPAN = nullcontext()
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, as Prometheus expects."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def cumulative(self):
+        """Return [(upper bound, observations <= bound), ...] ending with +Inf."""
+        with self._lock:
+            counts = list(self.counts)
+        total = 0
+        result = []
+        for bound, count in zip((*self.buckets, float("inf")), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Registry:
+    """Named counters and histograms, keyed by (name, sorted label items)."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        try:
+            return self.histograms[key]
+        except KeyError:
+            with self._lock:
+                return self.histograms.setdefault(key, Histogram())
+
+    def collect(self):
+        """Return copies of the counters and histograms dicts."""
+        with self._lock:
+            return dict(self.counters), dict(self.histograms)
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+REGISTRY = Registry()
+
+
+class _Span:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+def enabled():
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Turn instrumentation off; spans and counters become no-ops."""
+    global _enabled
+    _enabled = False
+
+
+def span(stage, **labels):
+    """Context manager timing a block into the stage duration histogram."""
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(REGISTRY.histogram(STAGE_HISTOGRAM, stage=stage, **labels))
+
+
+def observe(stage, seconds, **labels):
+    """Record an already measured stage duration."""
+    if _enabled:
+        REGISTRY.histogram(STAGE_HISTOGRAM, stage=stage, **labels).observe(seconds)
+
+
+def increment(name, amount=1, **labels):
+    """Add ``amount`` to the counter ``name`` with the given labels."""
+    if _enabled:
+        REGISTRY.increment(name, amount, **labels)
+
+
+def _format_labels(labels, extra=()):
+    items = [*labels, *extra]
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in items)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def render_prometheus(registry=REGISTRY):
+    """Return every metric in the Prometheus text exposition format."""
+    counters, histograms = registry.collect()
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {PREFIX}{name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for (metric, labels), histogram in sorted(histograms.items(), key=lambda item: item[0]):
+            if metric != name:
+                continue
+            for bound, count in histogram.cumulative():
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', _format_bound(bound))])} {count}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {histogram.sum}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot(registry=REGISTRY):
+    """Return every metric as a JSON-serializable dict."""
+    def key(name, labels):
+        return PREFIX + name + _format_labels(labels)
+
+    counters, histograms = registry.collect()
+    return {
+        "timestamp": time.time(),
+        "counters": {key(name, labels): value for (name, labels), value in counters.items()},
+        "histograms": {
+            key(name, labels): {
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "buckets": {_format_bound(bound): count for bound, count in histogram.cumulative()},
+            }
+            for (name, labels), histogram in histograms.items()
+        },
+    }
+
+
+def write_snapshot(path, registry=REGISTRY):
+    """Atomically replace ``path`` with the current snapshot."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(snapshot(registry), file)
+    os.replace(tmp_path, path)
+
+
+def start_snapshot_writer(path, interval=SNAPSHOT_INTERVAL):
+    """Write a snapshot to ``path`` every ``interval`` seconds from a daemon thread."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot(path)
+            except OSError as e:
+                logger.warning(f"Could not write metrics snapshot: {e}")
+
+    thread = threading.Thread(target=run, name="metrics-snapshot", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_http_server(port, address="127.0.0.1"):
+    """Serve /metrics in Prometheus text format from a daemon thread."""
+    # http.server is a third of this module's import time; only the exporter needs it
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_from_env():
+    """Start the exporters configured by METRICS_PORT and METRICS_SNAPSHOT_PATH, if any."""
+    if not _enabled:
+        return
+    port = os.environ.get("METRICS_PORT")
+    if port:
+        start_http_server(int(port), os.environ.get("METRICS_ADDRESS", "127.0.0.1"))
+        logger.info(f"Serving metrics on port {port}.")
+    path = os.environ.get("METRICS_SNAPSHOT_PATH")
+    if path:
+        start_snapshot_writer(path)
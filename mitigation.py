@@ -0,0 +1,190 @@
+"""
+What-if sweep over retrofit options.
+
+``sweep(user_input)`` takes one structure, enumerates every combination of
+the mitigation options the app offers (vegetation clearance, roof, vents,
+eaves, windows and exterior siding; thousands of variants) and ranks them by
+the predicted probability of major damage or destruction.
+
+Only actual upgrades are offered: options that describe the structure
+rather than a retrofit ("No Windows", an unscreened vent), downgrades
+(combustible roofs and siding) and the unspecific roof "Other" are left out,
+and so are options the model has no feature for (the app's ">100'"
+clearance and mesh-screen labels lost their "<>" in training): setting no
+feature is not a change the model can score.
+
+The app's VEGCLERANCE and ROOFCONSTRUCTR keys are read as their truncated
+feature columns (prediction.FEATURE_PREFIXES), which predict_risk does not
+do, so the sweep's baseline can differ from the app's own prediction.
+
+Several options can still encode to the same model input, so each field's
+options are first collapsed to their distinct encodings. Only
+the distinct combinations are built, directly as one-hot rows around the
+structure's fixed fields, and scored in a single engine call; every variant
+then reads its result from the combination it encodes to.
+"""
+import time
+
+import numpy as np
+
+import metrics
+import prediction
+
+# Choices offered by the app's selectboxes, keyed by input field
+FIELD_OPTIONS = {
+    "VEGCLERANCE": ["0-30'", "30-60'", "60-100'", ">100'", "Unknown"],
+    "STRUCTURET_STANDARDIZED": [
+        "Single Family Residence", "Mobile Home", "Non-habitable",
+        "Outbuilding", "Commercial Building", "Multi Family Residence",
+        "Public Building", "Mixed Use", "Other",
+    ],
+    "ROOFCONSTRUCTR": ["Asphalt", "Fire Resistant", "Metal", "Unknown",
+                       "Tile", "Combustible", "Wood", "Concrete", "Other"],
+    "EAVES": ["Unknown", "Unenclosed", "Enclosed", "No Eaves", "Not Applicable"],
+    "VENTSCREEN": ["Yes", "No", "Mesh Screen <= 1/8",
+                   "No Vents", "Unscreened", "Mesh Screen > 1/8", "Unknown"],
+    "EXTERIORSI": ["Combustible", "Ignition Resistant", "Fire Resistant", "Unknown"],
+    "WINDOWPANE": ["Single Pane", "No Windows", "Multi Pane", "Unknown"],
+    "TOPOGRAPHY": ["Flat Ground", "Slope", "Ridge Top", "Saddle", "Chimney", "Unknown"],
+}
+
+# Fields a homeowner can change by retrofitting
+MITIGATION_FIELDS = ("VEGCLERANCE", "ROOFCONSTRUCTR", "VENTSCREEN", "EAVES", "WINDOWPANE", "EXTERIORSI")
+
+# Options that are not something to retrofit to: "Unknown" is missing survey
+# data, "Other" names no material, and the rest describe a structure without
+# the feature or are downgrades
+EXCLUDED_OPTIONS = {
+    "VEGCLERANCE": ("Unknown",),
+    "ROOFCONSTRUCTR": ("Unknown", "Other", "Combustible", "Wood"),
+    "VENTSCREEN": ("Unknown", "No", "No Vents", "Unscreened"),
+    "EAVES": ("Unknown", "No Eaves", "Not Applicable"),
+    "WINDOWPANE": ("Unknown", "No Windows"),
+    "EXTERIORSI": ("Unknown", "Combustible"),
+}
+
+# Classes whose combined probability ranks the variants
+SEVERE_CLASSES = ("Major (26-50%)", "Destroyed (>50%)")
+
+DEFAULT_LIMIT = 20
+
+
+def field_options(user_input, fields=MITIGATION_FIELDS, exclude=EXCLUDED_OPTIONS):
+    """
+    Return {field: [option, ...]} to sweep; the structure's current value always comes first.
+
+    ``exclude`` maps each field to the options that are never offered as a change.
+    """
+    options = {}
+    for field in fields:
+        current = user_input.get(field)
+        excluded = exclude.get(field, ())
+        choices = [value for value in FIELD_OPTIONS[field] if value not in excluded and value != current]
+        options[field] = [current, *choices]
+    return options
+
+
+def _column(field):
+    """Return the training column an input field's features were named after."""
+    return prediction.FEATURE_PREFIXES.get(field, field)
+
+
+def _encoding_groups(encoder, field, options):
+    """
+    Collapse ``options`` to their distinct encodings.
+
+    Returns:
+        tuple: (list of feature positions, one per distinct encoding, None
+        for options that set no feature; np.ndarray giving each option's group).
+    """
+    positions, groups = [], []
+    for value in options:
+        position = encoder.lookup(_column(field), value)
+        if position not in positions:
+            positions.append(position)
+        groups.append(positions.index(position))
+    return positions, np.array(groups, dtype=np.intp)
+
+
+def sweep(user_input, fields=MITIGATION_FIELDS, options=None, limit=DEFAULT_LIMIT, severe_classes=SEVERE_CLASSES):
+    """
+    Score every combination of mitigation options for one structure.
+
+    Args:
+        user_input (dict): The structure, as passed to predict_risk.
+        fields (sequence): Fields to vary; the rest stay as given.
+        options (dict, optional): {field: [option, ...]} overriding field_options().
+        limit (int, optional): Ranked variants to return; None for all.
+        severe_classes (sequence): Labels whose probabilities are summed for ranking.
+
+    Returns:
+        dict: ``baseline`` (the structure as it is), ``variants`` (best
+        first, one per distinct model input, with the fewest changes that
+        reach it; each with its ``changes``, ``severe_probability``,
+        ``reduction`` against the baseline, ``predicted_risk`` and
+        ``probabilities``), ``evaluated`` (option combinations), ``scored``
+        (distinct model inputs scored) and ``seconds``.
+    """
+    started = time.perf_counter()
+    encoder = prediction.get_feature_encoder()
+    class_names = prediction.get_class_names()
+    severe = np.isin(np.asarray(class_names, dtype=str), list(severe_classes))
+
+    if options is None:
+        options = field_options(user_input, fields)
+    else:
+        options = {field: [user_input.get(field), *(v for v in options[field] if v != user_input.get(field))]
+                   for field in fields}
+    # An option that sets no feature would be scored as a blank field, not as the option
+    options = {field: [values[0], *(v for v in values[1:] if encoder.lookup(_column(field), v) is not None)]
+               for field, values in options.items()}
+
+    with metrics.span("whatif_sweep"):
+        # One row for each distinct combination of encodings
+        fixed = {_column(field): value for field, value in user_input.items() if field not in options}
+        base, _ = encoder.encode(fixed)
+        encodings = [_encoding_groups(encoder, field, values) for field, values in options.items()]
+        shape = tuple(len(positions) for positions, _ in encodings)
+        X = np.repeat(base, int(np.prod(shape)), axis=0)
+        row_groups = np.indices(shape).reshape(len(shape), -1)
+        for (positions, _), group_of_row in zip(encodings, row_groups):
+            for group, position in enumerate(positions):
+                if position is not None:
+                    X[group_of_row == group, position] = 1
+        predicted_class, probabilities = prediction.get_inference_engine().predict_with_proba(X)
+
+        # Every option combination, read back from its encoding combination
+        option_groups = np.meshgrid(*(groups for _, groups in encodings), indexing="ij")
+        combination = np.ravel_multi_index([g.ravel() for g in option_groups], shape)
+        option_index = np.indices(tuple(len(values) for values in options.values())).reshape(len(options), -1)
+        n_changes = (option_index != 0).sum(axis=0)
+        severe_probability = probabilities[:, severe].sum(axis=1)[combination]
+
+        # Lowest risk first; among equal risks, the fewest changes. Variants
+        # that encode to the same model input keep only their simplest form.
+        order = np.lexsort((n_changes, severe_probability))
+        _, first = np.unique(combination[order], return_index=True)
+        order = order[np.sort(first)]
+        if limit is not None:
+            order = order[:limit]
+
+    fields_values = list(options.items())
+
+    def describe(variant):
+        row = combination[variant]
+        return {
+            "changes": {field: values[option_index[axis, variant]]
+                        for axis, (field, values) in enumerate(fields_values) if option_index[axis, variant]},
+            "severe_probability": float(severe_probability[variant]),
+            "reduction": float(severe_probability[0] - severe_probability[variant]),
+            "predicted_risk": str(class_names[int(predicted_class[row])]),
+            "probabilities": {str(label): float(p) for label, p in zip(class_names, probabilities[row])},
+        }
+
+    return {
+        "baseline": describe(0),
+        "variants": [describe(variant) for variant in order],
+        "evaluated": int(combination.size),
+        "scored": int(X.shape[0]),
+        "seconds": time.perf_counter() - started,
+    }
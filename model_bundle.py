@@ -0,0 +1,251 @@
+"""
+Versioned model bundle: a manifest plus raw NumPy arrays.
+
+A bundle is a directory holding ``manifest.json`` and one ``.npy`` file per
+FlatForest array. The manifest carries everything else prediction needs:
+the feature schema, the class labels, a model version and a SHA-256 per
+array plus one over the whole bundle. Nothing is pickled, so loading runs
+no code from the file, and the arrays are memory-mapped read-only: every
+process serving the same bundle shares one physical copy through the page
+cache, and a cold start costs a few file opens instead of an unpickle.
+
+Array files are named after their content hash and ``manifest.json`` is
+replaced atomically, so writing a new model into a bundle that is being
+served is safe: readers see either the old manifest and arrays or the new
+ones. Arrays no longer referenced are removed afterwards; processes that
+still map them keep their copy until they reload.
+
+Usage:
+    python model_bundle.py export model_bundle       # from the pickle artifacts
+    python model_bundle.py verify model_bundle
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from forest_engine import FlatForest
+
+BUNDLE_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+
+# FlatForest arrays and the dtype each is stored with
+ARRAY_DTYPES = {
+    "feature": np.int64,
+    "threshold": np.float64,
+    "children": np.int64,
+    "missing_go_to_left": np.bool_,
+    "value": np.float64,
+    "roots": np.int64,
+    "classes": np.int64,
+}
+
+
+class BundleError(ValueError):
+    """The bundle is missing, malformed or fails its checksums."""
+
+
+class ModelBundle:
+    """
+    A loaded bundle.
+
+    Attributes:
+        forest (FlatForest): The inference engine, over memory-mapped arrays.
+        feature_names (list): One-hot feature names, in model input order.
+        class_names (np.ndarray): Risk labels indexed by encoded class (object array).
+        version (str): Model version from the manifest.
+        manifest (dict): The full manifest.
+    """
+
+    def __init__(self, forest, feature_names, class_names, manifest):
+        self.forest = forest
+        self.feature_names = feature_names
+        self.class_names = class_names
+        self.manifest = manifest
+        self.version = manifest["version"]
+
+
+def _sha256_file(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while block := file.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _bundle_checksum(manifest):
+    """Hash of the schema, labels and every array checksum."""
+    covered = {key: manifest[key] for key in ("format", "version", "feature_names", "class_names")}
+    covered["arrays"] = {name: manifest["arrays"][name]["sha256"] for name in sorted(manifest["arrays"])}
+    return hashlib.sha256(json.dumps(covered, sort_keys=True).encode()).hexdigest()
+
+
+def write_bundle(path, forest, feature_names, class_names, version=None, metadata=None):
+    """
+    Write ``forest`` and its schema as a bundle at ``path``.
+
+    Args:
+        path (str): Bundle directory; created if needed, updated in place otherwise.
+        forest (FlatForest): The exported model.
+        feature_names (list): Feature names the model was trained on.
+        class_names (sequence): Risk labels, indexed by the model's classes.
+        version (str, optional): Model version; defaults to the date and checksum.
+        metadata (dict, optional): Extra JSON stored under "metadata".
+
+    Returns:
+        dict: The manifest written.
+    """
+    if forest.value.shape[1] != len(class_names):
+        raise BundleError(f"Forest has {forest.value.shape[1]} classes but {len(class_names)} labels were given.")
+    os.makedirs(path, exist_ok=True)
+
+    arrays = {}
+    for name, dtype in ARRAY_DTYPES.items():
+        array = np.ascontiguousarray(getattr(forest, "classes_" if name == "classes" else name), dtype=dtype)
+        tmp_path = os.path.join(path, f".{name}.npy.tmp")
+        with open(tmp_path, "wb") as file:
+            np.save(file, array, allow_pickle=False)
+        sha256 = _sha256_file(tmp_path)
+        file_name = f"{name}-{sha256[:16]}.npy"
+        os.replace(tmp_path, os.path.join(path, file_name))
+        arrays[name] = {"file": file_name, "dtype": np.dtype(dtype).str, "shape": list(array.shape),
+                        "sha256": sha256}
+
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": version,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "feature_names": [str(name) for name in feature_names],
+        "class_names": [str(label) for label in class_names],
+        "n_trees": int(forest.n_trees),
+        "n_nodes": int(len(forest.feature)),
+        "arrays": arrays,
+        "metadata": metadata or {},
+    }
+    if manifest["version"] is None:
+        manifest["version"] = time.strftime("%Y%m%d") + "-" + _bundle_checksum(manifest)[:8]
+    manifest["checksum"] = _bundle_checksum(manifest)
+
+    tmp_manifest = os.path.join(path, f".{MANIFEST_NAME}.tmp")
+    with open(tmp_manifest, "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp_manifest, os.path.join(path, MANIFEST_NAME))
+
+    # Drop arrays from earlier versions; mappings held elsewhere stay valid
+    current = {entry["file"] for entry in arrays.values()}
+    for name in os.listdir(path):
+        if name.endswith(".npy") and name not in current:
+            os.remove(os.path.join(path, name))
+    return manifest
+
+
+def read_manifest(path):
+    """Return the parsed manifest of the bundle at ``path``."""
+    try:
+        with open(os.path.join(path, MANIFEST_NAME)) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError) as e:
+        raise BundleError(f"Cannot read bundle manifest in {path}: {e}") from e
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise BundleError(f"Unsupported bundle format {manifest.get('format')!r} in {path}.")
+    return manifest
+
+
+def load_bundle(path, mmap=True, verify=True):
+    """
+    Load the bundle at ``path``.
+
+    Args:
+        path (str): Bundle directory.
+        mmap (bool): Memory-map the arrays read-only instead of reading them.
+        verify (bool): Check every array file against its SHA-256. Shapes,
+            dtypes and the manifest checksum are always checked.
+
+    Returns:
+        ModelBundle: The loaded model.
+
+    Raises:
+        BundleError: When the bundle is incomplete or inconsistent.
+    """
+    manifest = read_manifest(path)
+    if _bundle_checksum(manifest) != manifest.get("checksum"):
+        raise BundleError(f"Manifest checksum mismatch in {path}.")
+
+    arrays = {}
+    for name, entry in manifest["arrays"].items():
+        file_path = os.path.join(path, entry["file"])
+        try:
+            digest = _sha256_file(file_path) if verify else None
+            array = np.load(file_path, mmap_mode="r" if mmap else None, allow_pickle=False)
+        except (OSError, ValueError) as e:
+            raise BundleError(f"Cannot load {entry['file']} from {path}: {e}") from e
+        if verify and digest != entry["sha256"]:
+            raise BundleError(f"Checksum mismatch for {entry['file']} in {path}.")
+        if array.dtype.str != entry["dtype"] or list(array.shape) != entry["shape"]:
+            raise BundleError(f"{entry['file']} is {array.dtype.str}{list(array.shape)}, "
+                              f"manifest says {entry['dtype']}{entry['shape']}.")
+        arrays[name] = array
+
+    missing = set(ARRAY_DTYPES) - set(arrays)
+    if missing:
+        raise BundleError(f"Bundle in {path} lacks arrays: {sorted(missing)}.")
+    if arrays["value"].shape[1] != len(manifest["class_names"]):
+        raise BundleError("Class labels do not match the model's classes.")
+    if arrays["feature"].size and int(arrays["feature"].max()) >= len(manifest["feature_names"]):
+        raise BundleError("The model splits on features outside the feature schema.")
+
+    forest = FlatForest(arrays["feature"], arrays["threshold"], arrays["children"],
+                        arrays["missing_go_to_left"], arrays["value"], arrays["roots"], arrays["classes"])
+    return ModelBundle(forest, list(manifest["feature_names"]),
+                       np.array(manifest["class_names"], dtype=object), manifest)
+
+
+def export_from_pickles(path, model_path, feature_names_path, label_mappings_path, version=None):
+    """
+    Convert the pickled model, feature names and label mappings into a bundle.
+
+    This unpickles the existing artifacts once; only use it on files you trust.
+    """
+    import pickle
+
+    with open(model_path, "rb") as file:
+        model = pickle.load(file)
+    with open(feature_names_path, "rb") as file:
+        feature_names = pickle.load(file)
+    class_names = np.load(label_mappings_path, allow_pickle=True)
+    return write_bundle(path, FlatForest.from_sklearn(model), feature_names, class_names, version=version,
+                        metadata={"source": os.path.basename(model_path)})
+
+
+def main(argv=None):
+    import prediction
+
+    parser = argparse.ArgumentParser(description="Create or check a model bundle.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="convert the pickle artifacts into a bundle")
+    export.add_argument("bundle", nargs="?", default=prediction.BUNDLE_PATH)
+    export.add_argument("--version", help="model version (default: date and checksum)")
+    verify = commands.add_parser("verify", help="load a bundle and check every checksum")
+    verify.add_argument("bundle", nargs="?", default=prediction.BUNDLE_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        manifest = export_from_pickles(args.bundle, prediction.MODEL_PATH, prediction.FEATURE_NAMES_PATH,
+                                       prediction.LABEL_MAPPINGS_PATH, version=args.version)
+        print(f"Wrote model {manifest['version']} ({manifest['n_trees']} trees, {manifest['n_nodes']} nodes) "
+              f"to {args.bundle}.", file=sys.stderr)
+    else:
+        try:
+            bundle = load_bundle(args.bundle, verify=True)
+        except BundleError as e:
+            raise SystemExit(str(e))
+        print(f"{args.bundle}: model {bundle.version}, {len(bundle.feature_names)} features, "
+              f"{len(bundle.class_names)} classes, checksums OK.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Multi-process scoring over one shared copy of the model.
+
+The parent copies the flattened forest's node arrays once into a single
+``multiprocessing.shared_memory`` block. Worker processes attach to that
+block and build their FlatForest on views of it, so N workers add no model
+copies, only their own interpreter and per-chunk scratch space. The
+encoder's lookup tables are a few hundred dict entries and are rebuilt in
+each worker from the feature names passed along with the block.
+
+Workers only have the node arrays, not the fitted scikit-learn model, so they
+always use the engine's NumPy walk (see forest_engine.py); on large chunks
+that is roughly 2.5x slower per row than in-process scoring of a forest
+exported from the model, which pays off from about three workers.
+
+Chunks are handed to whichever worker is free and results come back in
+input order, with at most ``max_in_flight`` chunks outstanding, so a writer
+can append them as they arrive while memory stays bounded.
+
+With ``explain``, workers also return each row's feature contributions. The
+per-leaf contribution table is built once, in the parent, and shared in the
+same block; workers hand their views of it to the forest with
+``set_leaf_contributions``.
+
+Usage (see batch_score.py --workers):
+    with ParallelScorer.from_prediction(workers=8) as scorer:
+        for context, (risk, probabilities, unmatched) in scorer.imap(pairs):
+            ...
+"""
+import collections
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from feature_encoder import FeatureEncoder
+from forest_engine import FlatForest
+
+# FlatForest constructor arrays, in argument order
+FOREST_ARRAYS = ("feature", "threshold", "children", "missing_go_to_left", "value", "roots", "classes_")
+
+# Byte alignment of each array inside the shared block
+_ALIGNMENT = 64
+
+# Set in each worker by _init_worker
+_worker = None
+
+
+class SharedForest:
+    """
+    FlatForest arrays copied into one shared-memory block.
+
+    ``spec`` is a small picklable description (block name, array layout,
+    feature and class names) that ``attach`` turns back into a forest.
+
+    With ``groups``, the per-leaf contribution table (about 31 MiB for the
+    12 input fields) is built here once and shared with the arrays, rather
+    than rebuilt by every worker that explains.
+
+    Args:
+        forest (FlatForest): The model to share.
+        feature_names (list): The model's feature names.
+        class_names (sequence): Risk labels indexed by encoded class.
+        groups (tuple, optional): (feature groups, number of groups) whose
+            contribution table to share; see score_frame.
+    """
+
+    def __init__(self, forest, feature_names, class_names, groups=None):
+        arrays = {name: np.ascontiguousarray(getattr(forest, name)) for name in FOREST_ARRAYS}
+        if groups is not None:
+            arrays["leaf_row"], arrays["leaf_table"] = forest.leaf_contributions(*groups)
+        layout, size = {}, 0
+        for name, array in arrays.items():
+            size = -(-size // _ALIGNMENT) * _ALIGNMENT
+            layout[name] = (size, array.dtype.str, array.shape)
+            size += array.nbytes
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, array in arrays.items():
+            offset, dtype, shape = layout[name]
+            np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)[...] = array
+
+        self.nbytes = size
+        self.spec = {
+            "name": self.shm.name,
+            "layout": layout,
+            "feature_names": list(feature_names),
+            "class_names": [str(label) for label in class_names],
+            "groups": None if groups is None else (np.asarray(groups[0]).tolist(), groups[1]),
+        }
+
+    def close(self):
+        """Release and remove the block; attached workers must have exited."""
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def attach(spec):
+    """
+    Open the block described by ``spec`` and build read-only views on it.
+
+    Returns:
+        tuple: (FlatForest, FeatureEncoder, np.ndarray of class names,
+        SharedMemory handle that must stay referenced while the forest is used).
+    """
+    shm = shared_memory.SharedMemory(name=spec["name"])
+
+    def view(name):
+        offset, dtype, shape = spec["layout"][name]
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        array.flags.writeable = False
+        return array
+
+    forest = FlatForest(*(view(name) for name in FOREST_ARRAYS))
+    if spec["groups"] is not None:
+        forest.set_leaf_contributions(*spec["groups"], view("leaf_row"), view("leaf_table"))
+    encoder = FeatureEncoder(spec["feature_names"])
+    return forest, encoder, np.array(spec["class_names"], dtype=object), shm
+
+
+def _init_worker(spec):
+    global _worker
+    _worker = attach(spec)
+
+
+def score_frame(frame, groups=None):
+    """
+    Score one chunk in a worker; returns (risk labels, probabilities, unmatched).
+
+    With ``groups`` ((feature groups, number of groups), as from
+    prediction.get_contribution_fields), the contributions are appended.
+    """
+    forest, encoder, class_names, _ = _worker
+    X, unmatched = encoder.encode_batch(frame, sparse=True)
+    if groups is None:
+        predicted_class, probabilities = forest.predict_with_proba(X)
+        return class_names[predicted_class.astype(int)], probabilities, unmatched
+    predicted_class, probabilities, contributions = forest.predict_with_contributions(X, *groups)
+    return class_names[predicted_class.astype(int)], probabilities, unmatched, contributions
+
+
+class ParallelScorer:
+    """
+    Process pool scoring chunks against a SharedForest.
+
+    Args:
+        shared (SharedForest): The model block; closed with the scorer.
+        workers (int): Worker processes.
+        max_in_flight (int, optional): Chunks outstanding at once (default 2 per worker).
+        groups (tuple, optional): (feature groups, number of groups) to
+            explain every prediction with; see score_frame. Pass the same
+            groups to SharedForest so workers use its contribution table.
+    """
+
+    def __init__(self, shared, workers, max_in_flight=None, groups=None):
+        self.shared = shared
+        self.workers = workers
+        self.max_in_flight = max_in_flight or 2 * workers
+        self.groups = groups
+        # spawn: workers start clean and get the model only through the block
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker, initargs=(shared.spec,))
+
+    @classmethod
+    def from_prediction(cls, workers=None, max_in_flight=None, explain=False):
+        """
+        Share the model prediction.py serves (bundle or pickles) with ``workers`` processes.
+
+        With ``explain``, contributions are grouped by the fields of
+        prediction.get_contribution_fields.
+        """
+        import prediction
+
+        groups = None
+        if explain:
+            feature_groups, fields = prediction.get_contribution_fields()
+            groups = (feature_groups, len(fields))
+        shared = SharedForest(prediction.get_inference_engine(), prediction.get_feature_names(),
+                              prediction.get_class_names(), groups=groups)
+        return cls(shared, workers or os.cpu_count() or 1, max_in_flight, groups)
+
+    def imap(self, items):
+        """
+        Score frames in parallel and yield results in input order.
+
+        Args:
+            items (iterable): (frame, context) pairs. Only ``frame`` is sent
+                to a worker; ``context`` stays here and is yielded back.
+
+        Yields:
+            tuple: (context, (risk labels, probabilities, unmatched)), plus
+            contributions in the inner tuple when the scorer explains.
+        """
+        pending = collections.deque()
+        for frame, context in items:
+            pending.append((context, self.pool.submit(score_frame, frame, self.groups)))
+            if len(pending) >= self.max_in_flight:
+                context, future = pending.popleft()
+                yield context, future.result()
+        while pending:
+            context, future = pending.popleft()
+            yield context, future.result()
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.shared.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
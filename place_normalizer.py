@@ -0,0 +1,247 @@
+"""
+Fuzzy matching of free-text place inputs to the model's categories.
+
+The CITY, COUNTY and COMMUNITY features are one-hot columns, so a place the
+encoder does not recognise exactly ("Paradise" for "Paradise Central
+Southeast A", "Sant Rosa" for "Santa Rosa") silently contributes nothing.
+``PlaceNormalizer`` maps raw input to the closest known values with a
+confidence score.
+
+Each field's known values are loaded once into a trigram index: a posting
+list of value ids per trigram. A lookup counts shared trigrams for every
+candidate in one ``np.bincount`` over the query's postings, keeps the best
+few by Dice coefficient and re-ranks those by edit distance. With a few
+hundred values a lookup takes well under a millisecond.
+
+Usage:
+    normalizer = get_place_normalizer()
+    normalizer.match("CITY", "sant rosa")   # [Match(value='Santa Rosa', score=0.83), ...]
+    record, matches = normalizer.normalize_record(user_input)
+"""
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from gazetteer import PLACE_FIELDS, model_place_names, normalize_name
+
+# Lowest score at which a fuzzy match replaces the raw input
+MIN_SCORE = 0.75
+# Candidates kept from the trigram pass for edit-distance re-ranking
+RERANK_CANDIDATES = 10
+# Score of a query that is the leading words of a known name ("Paradise" for
+# "Paradise Central Southeast A"), shared out when several names start that way
+PREFIX_SCORE = 0.8
+PREFIX_BONUS = 0.15
+
+# Words people add around place names that the categories do not carry
+_PREFIXES = ("city of ", "town of ")
+_SUFFIXES = (" county", " ca", " california")
+
+Match = namedtuple("Match", ["value", "score"])
+
+
+def place_key(name):
+    """Return the matching key of a place name: normalize_name without "County", "City of" and the like."""
+    key = normalize_name(name)
+    for prefix in _PREFIXES:
+        if key.startswith(prefix):
+            key = key[len(prefix):]
+    for suffix in _SUFFIXES:
+        if key.endswith(suffix):
+            key = key[:-len(suffix)]
+    return key
+
+
+def trigrams(text):
+    """Return the set of character trigrams of a normalized name, padded at the word edges."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+class TrigramIndex:
+    """
+    Inverted trigram index over a list of names.
+
+    Args:
+        names (iterable): The known values. Names that normalize alike
+            ("Agoura Hills", "Agoura hills") share one entry, listed under the
+            first; each is still matched as itself.
+    """
+
+    def __init__(self, names):
+        self.names, self.keys, self._exact, self._known = [], [], {}, set()
+        for name in names:
+            key = place_key(name)
+            if not key:
+                continue
+            if key not in self._exact:
+                self._exact[key] = len(self.names)
+                self.names.append(name)
+                self.keys.append(key)
+            self._known.add(name)
+
+        postings = {}
+        self._sizes = np.zeros(len(self.names), dtype=np.intp)
+        for i, key in enumerate(self.keys):
+            grams = trigrams(key)
+            self._sizes[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: np.array(ids, dtype=np.intp) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        """Whether ``name`` is one of the known values, exactly as written."""
+        return name in self._known
+
+    def search(self, text, limit=5):
+        """
+        Return up to ``limit`` Matches for ``text``, best first.
+
+        The score is the mean of the trigram Dice coefficient and the
+        normalized edit-distance similarity; an exact match (ignoring case
+        and spacing) scores 1.0, and a query that is the leading words of
+        known names at least PREFIX_SCORE. Ties are broken alphabetically.
+        A known value is returned as written, not as the first name of its
+        entry.
+        """
+        key = place_key(text)
+        if not key:
+            return []
+        exact = self._exact.get(key)
+        if exact is not None:
+            exact_name = text if text in self._known else self.names[exact]
+            if limit == 1:
+                return [Match(exact_name, 1.0)]
+
+        grams = trigrams(key)
+        lists = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not lists:
+            return []
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.names))
+        dice = 2 * shared / (len(grams) + self._sizes)
+        candidates = np.argsort(-dice, kind="stable")[:RERANK_CANDIDATES]
+
+        candidates = [i for i in candidates if shared[i]]
+        prefixed = [i for i in candidates if self.keys[i].startswith(key + " ")]
+        matches = []
+        for i in candidates:
+            other = self.keys[i]
+            similarity = 1 - edit_distance(key, other) / max(len(key), len(other))
+            score = (dice[i] + similarity) / 2
+            if i == exact:
+                matches.append(Match(exact_name, 1.0))
+                continue
+            if i in prefixed:
+                score = max(score, PREFIX_SCORE + PREFIX_BONUS / len(prefixed))
+            matches.append(Match(self.names[i], float(score)))
+        matches.sort(key=lambda match: (-match.score, match.value))
+        return matches[:limit]
+
+
+class PlaceNormalizer:
+    """
+    Per-field trigram indexes over the model's place categories.
+
+    Args:
+        names (dict): {field: [known value, ...]} for CITY, COUNTY and COMMUNITY.
+        min_score (float): Lowest score at which normalize() accepts a match.
+    """
+
+    def __init__(self, names, min_score=MIN_SCORE):
+        self.min_score = min_score
+        self._indexes = {field: TrigramIndex(names.get(field, ())) for field in PLACE_FIELDS}
+
+    def match(self, field, text, limit=5):
+        """Return up to ``limit`` known values of ``field`` resembling ``text``, best first."""
+        return self._indexes[field].search(text, limit)
+
+    def normalize(self, field, text):
+        """
+        Return the Match ``text`` should be replaced with, or None.
+
+        None means no known value scored at least ``min_score``; the raw
+        input is then left as it is. Input that already is a known value,
+        case included, is matched to itself.
+        """
+        if text is None or not isinstance(text, str):
+            return None
+        if text in self._indexes[field]:
+            return Match(text, 1.0)
+        matches = self.match(field, text, limit=1)
+        if not matches or matches[0].score < self.min_score:
+            return None
+        return matches[0]
+
+    def normalize_record(self, record):
+        """
+        Replace the place fields of one input record with their best matches.
+
+        Returns:
+            tuple: (new record, {field: Match or None} for each place field present).
+        """
+        record = dict(record)
+        matches = {}
+        for field in PLACE_FIELDS:
+            if field in record:
+                matches[field] = self.normalize(field, record[field])
+                if matches[field] is not None:
+                    record[field] = matches[field].value
+        return record, matches
+
+    def normalize_frame(self, frame):
+        """
+        Replace the place columns of a DataFrame with their best matches.
+
+        Each distinct value is looked up once.
+
+        Returns:
+            tuple: (new DataFrame, {field: {raw value: Match}} for the values
+            that were changed).
+        """
+        frame = frame.copy()
+        changed = {}
+        for field in PLACE_FIELDS:
+            if field not in frame.columns:
+                continue
+            mapping = {}
+            for value in frame[field].dropna().unique():
+                match = self.normalize(field, value)
+                if match is not None and match.value != value:
+                    mapping[value] = match
+            if mapping:
+                frame[field] = frame[field].astype(object).replace({raw: m.value for raw, m in mapping.items()})
+                changed[field] = mapping
+        return frame, changed
+
+
+_default_normalizer = None
+_default_normalizer_lock = threading.Lock()
+
+
+def get_place_normalizer():
+    """Return the process-wide normalizer over the model's place categories, creating it on first use."""
+    global _default_normalizer
+    if _default_normalizer is None:
+        with _default_normalizer_lock:
+            if _default_normalizer is None:
+                from prediction import get_feature_names
+
+                _default_normalizer = PlaceNormalizer(model_place_names(get_feature_names()))
+    return _default_normalizer
@@ -1,60 +1,380 @@
+import hashlib
+import logging
+import os
 import pickle
-import pandas as pd
+import threading
+import time
+
+import metrics
+import model_bundle
 import numpy as np
+from feature_encoder import FeatureEncoder
+from forest_engine import FlatForest
+from prediction_cache import PredictionCache
 
-# Loading the trained random forest model
-with open('random_forest_model.pkl', 'rb') as model_file:
-    random_forest_model = pickle.load(model_file)
+logger = logging.getLogger(__name__)
 
-print("Model loaded successfully!")
+# Fields collected by the app for each structure
+INPUT_FIELDS = [
+    "CITY", "COUNTY", "COMMUNITY", "VEGCLERANCE", "STRUCTURET_STANDARDIZED",
+    "ROOFCONSTRUCTR", "EAVES", "VENTSCREEN", "EXTERIORSI", "WINDOWPANE",
+    "TOPOGRAPHY", "YEARBUILT",
+]
 
-# Load the saved feature names
-with open("all_feature_names.pkl", "rb") as file:
-    all_feature_names = pickle.load(file)
+# Fields whose feature columns were truncated to a different prefix in training
+FEATURE_PREFIXES = {"VEGCLERANCE": "VEGCLEARAN", "ROOFCONSTRUCTR": "ROOFCONSTR"}
+# Contribution group of features no input field stands for
+OTHER_FIELD = "OTHER"
 
-# Load the saved mappings
-class_names = np.load('label_mappings.npy', allow_pickle=True)
-print("Loaded Label Mappings:", class_names)
+# Model artifacts live next to this file
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(MODEL_DIR, "random_forest_model.pkl")
+FEATURE_NAMES_PATH = os.path.join(MODEL_DIR, "all_feature_names.pkl")
+LABEL_MAPPINGS_PATH = os.path.join(MODEL_DIR, "label_mappings.npy")
 
-def preprocess_input(user_input):
+# A model bundle (see model_bundle.py), when present, is used instead of the
+# pickle artifacts above: no unpickling, and its arrays are memory-mapped
+BUNDLE_PATH = os.environ.get("MODEL_BUNDLE_PATH", os.path.join(MODEL_DIR, "model_bundle"))
+# Check the bundle's array checksums on load
+BUNDLE_VERIFY = os.environ.get("MODEL_BUNDLE_VERIFY", "1").lower() not in ("0", "false", "no", "off")
+
+# Artifacts are loaded on first use and shared by every thread in the process
+_artifacts = {}
+_artifacts_lock = threading.RLock()
+
+# Seconds between checks of the artifacts on disk for a new model
+ARTIFACT_CHECK_INTERVAL = 5.0
+_last_artifact_check = 0.0
+
+# Prediction cache settings; the disk tier is off unless a path is given
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 1024))
+PREDICTION_CACHE_PATH = os.environ.get("PREDICTION_CACHE_PATH")
+_prediction_cache = None
+_prediction_cache_lock = threading.RLock()
+
+
+def _artifact(name, loader):
+    try:
+        return _artifacts[name]
+    except KeyError:
+        pass
+    with _artifacts_lock:
+        if name not in _artifacts:
+            _artifacts[name] = loader()
+        return _artifacts[name]
+
+
+def _load_model():
+    # Loading the trained random forest model
+    with open(MODEL_PATH, "rb") as model_file:
+        model = pickle.load(model_file)
+    logger.info("Model loaded successfully!")
+    return model
+
+
+def _bundle_manifest_path():
+    return os.path.join(BUNDLE_PATH, model_bundle.MANIFEST_NAME)
+
+
+def _load_bundle():
+    if not os.path.exists(_bundle_manifest_path()):
+        return None
+    bundle = model_bundle.load_bundle(BUNDLE_PATH, verify=BUNDLE_VERIFY)
+    logger.info(f"Model bundle {bundle.version} loaded from {BUNDLE_PATH}.")
+    return bundle
+
+
+def _load_feature_names():
+    # Load the saved feature names
+    with open(FEATURE_NAMES_PATH, "rb") as file:
+        return pickle.load(file)
+
+
+def _load_class_names():
+    # Load the saved mappings
+    class_names = np.load(LABEL_MAPPINGS_PATH, allow_pickle=True)
+    logger.info(f"Loaded Label Mappings: {class_names}")
+    return class_names
+
+
+def get_bundle():
+    """Return the loaded model bundle, or None when there is none and the pickles are used."""
+    return _artifact("bundle", _load_bundle)
+
+
+def get_model():
+    """Return the trained scikit-learn random forest, unpickling it on first use."""
+    return _artifact("model", _load_model)
+
+
+def get_feature_names():
+    """Return the one-hot feature names the model was trained on."""
+    bundle = get_bundle()
+    if bundle is not None:
+        return bundle.feature_names
+    return _artifact("feature_names", _load_feature_names)
+
+
+def get_class_names():
+    """Return the risk labels, indexed by encoded class."""
+    bundle = get_bundle()
+    if bundle is not None:
+        return bundle.class_names
+    return _artifact("class_names", _load_class_names)
+
+
+def get_feature_encoder():
+    """Return the encoder compiled from the model's feature names."""
+    return _artifact("feature_encoder", lambda: FeatureEncoder(get_feature_names()))
+
+
+def get_inference_engine():
+    """Return the flattened forest used for scoring, from the bundle or exported from the model."""
+    bundle = get_bundle()
+    if bundle is not None:
+        return bundle.forest
+    return _artifact("inference_engine", lambda: FlatForest.from_sklearn(get_model()))
+
+
+def _load_contribution_fields():
+    prefixes = {FEATURE_PREFIXES.get(field, field): i for i, field in enumerate(INPUT_FIELDS)}
+    fields = list(INPUT_FIELDS)
+    groups = np.empty(len(get_feature_names()), dtype=np.intp)
+    for i, name in enumerate(get_feature_names()):
+        matches = [prefix for prefix in prefixes if name == prefix or name.startswith(prefix + "_")]
+        if matches:
+            groups[i] = prefixes[max(matches, key=len)]
+        else:
+            if fields[-1] != OTHER_FIELD:
+                fields.append(OTHER_FIELD)
+            groups[i] = len(fields) - 1
+    return groups, fields
+
+
+def get_contribution_fields():
     """
-    Preprocess the user input to match the model's expected feature set.
+    Return how features are grouped for explanations.
+
+    Returns:
+        tuple: (np.ndarray with the group of every feature, list of group
+        names). The groups are INPUT_FIELDS, in order, matched by feature
+        prefix (see FEATURE_PREFIXES), plus OTHER_FIELD if any feature
+        belongs to none of them.
     """
-    # Convert user input to a DataFrame
-    input_df = pd.DataFrame([user_input])
+    return _artifact("contribution_fields", _load_contribution_fields)
+
 
-    # Perform one-hot encoding
-    processed_input = pd.get_dummies(input_df, columns=input_df.select_dtypes(include=['object']).columns[:])
+def artifact_fingerprint():
+    """Return a fingerprint of the model artifacts on disk (size and modification time)."""
+    parts = []
+    paths = [_bundle_manifest_path()]
+    if not os.path.exists(paths[0]):
+        paths = [MODEL_PATH, FEATURE_NAMES_PATH, LABEL_MAPPINGS_PATH]
+    for path in paths:
+        stat = os.stat(path)
+        parts.append(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
 
-    # Align with all features used in training
-    aligned_input = processed_input.reindex(columns=all_feature_names, fill_value=0)
 
-    return aligned_input.to_numpy()
+def _loaded_fingerprint():
+    """
+    Return the fingerprint of the loaded artifacts, reloading them when the
+    files on disk have changed (checked at most every ARTIFACT_CHECK_INTERVAL).
+    """
+    global _last_artifact_check
+    loaded = _artifact("fingerprint", artifact_fingerprint)
+
+    now = time.monotonic()
+    if now - _last_artifact_check < ARTIFACT_CHECK_INTERVAL:
+        return loaded
+    _last_artifact_check = now
+
+    current = artifact_fingerprint()
+    if current != loaded:
+        logger.info("Model artifacts changed on disk, reloading on next use.")
+        with _artifacts_lock:
+            _artifacts.clear()
+            _artifacts["fingerprint"] = current
+    return current
+
+
+def configure_prediction_cache(maxsize=PREDICTION_CACHE_SIZE, disk_path=PREDICTION_CACHE_PATH):
+    """
+    Replace the prediction cache.
+
+    Args:
+        maxsize (int): Entries kept in memory (LRU).
+        disk_path (str, optional): SQLite file for a cache that survives restarts.
+
+    Returns:
+        PredictionCache: The new cache.
+    """
+    global _prediction_cache
+    with _prediction_cache_lock:
+        if _prediction_cache is not None:
+            _prediction_cache.close()
+        _prediction_cache = PredictionCache(maxsize=maxsize, disk_path=disk_path)
+        return _prediction_cache
+
+
+def get_prediction_cache():
+    """Return the prediction cache, creating it with the default settings on first use."""
+    if _prediction_cache is None:
+        with _prediction_cache_lock:
+            if _prediction_cache is None:
+                return configure_prediction_cache()
+    return _prediction_cache
+
+
+def cache_key(user_input):
+    """
+    Return the canonical cache key for an input.
+
+    One entry per field in INPUT_FIELDS order holding what the value encodes
+    to, so inputs that produce the same feature vector share a cache entry.
+    """
+    encoder = get_feature_encoder()
+    key = [encoder.canonical(field, user_input.get(field)) for field in INPUT_FIELDS]
+
+    # Fields outside the form still count if they reach a feature column
+    extra = sorted(
+        (field, canonical) for field, value in user_input.items()
+        if field not in INPUT_FIELDS and (canonical := encoder.canonical(field, value)) is not None
+    )
+    if extra:
+        key.append(tuple(extra))
+    return tuple(key)
+
+
+def warm_up():
+    """
+    Load every model artifact and run one prediction so the first real
+    request does not pay for unpickling or scikit-learn's first-call setup.
+    """
+    predict_risk({field: None for field in INPUT_FIELDS})
+
+
+_LAZY_ATTRIBUTES = {
+    "random_forest_model": get_model,
+    "all_feature_names": get_feature_names,
+    "class_names": get_class_names,
+    "feature_encoder": get_feature_encoder,
+}
+
+
+def __getattr__(name):
+    # Keep the old module-level names working without loading at import time
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def preprocess_input(user_input):
+    """
+    Preprocess the user input to match the model's expected feature set.
+
+    Inputs without a matching feature column (unknown categories, numeric
+    YEARBUILT) are left at zero, as with get_dummies + reindex.
+    """
+    with metrics.span("encode", mode="single"):
+        encoded_input, _ = get_feature_encoder().encode(user_input)
+    return encoded_input
 
 def predict_risk(user_input):
     """
     Predict the wildfire risk category using the Random Forest model.
 
+    Repeated inputs are answered from the prediction cache.
+
     Args:
         user_input (dict): Dictionary of user-provided input features.
 
     Returns:
-        dict: Predicted risk category and probabilities for each category.
+        dict: Predicted risk category, probabilities for each category, and
+        the explanation: ``contributions`` ({field: {category: share of its
+        probability}}, see get_contribution_fields) and ``bias`` (the
+        probabilities before any split). Bias plus every field's
+        contribution gives each category's probability.
     """
+    prediction_cache = get_prediction_cache()
+    prediction_cache.set_fingerprint(_loaded_fingerprint())
+
+    key = cache_key(user_input)
+    result = prediction_cache.get(key)
+    # Entries stored on disk by older versions carry no explanation
+    if result is None or "contributions" not in result:
+        metrics.increment("prediction_cache_total", result="miss")
+        result = _predict_risk(user_input)
+        prediction_cache.put(key, result)
+    else:
+        metrics.increment("prediction_cache_total", result="hit")
+
+    # Callers get their own copy of the cached entry
+    return {
+        "predicted_risk": result["predicted_risk"],
+        "probabilities": dict(result["probabilities"]),
+        "contributions": {field: dict(values) for field, values in result["contributions"].items()},
+        "bias": dict(result["bias"]),
+    }
+
+def _predict_risk(user_input):
+    inference_engine = get_inference_engine()
+    class_names = get_class_names()
+    groups, fields = get_contribution_fields()
+
     # Preprocess the input
     processed_input = preprocess_input(user_input)
 
-    # Predict class
-    predicted_class = random_forest_model.predict(processed_input)
-
-    # Predict probabilities
-    predicted_probabilities = random_forest_model.predict_proba(processed_input)
+    # Predict class, probabilities and contributions in one pass over the trees
+    with metrics.span("inference", mode="single"):
+        predicted_class, predicted_probabilities, contributions = inference_engine.predict_with_contributions(
+            processed_input, groups, len(fields))
 
     # Map predicted class to risk label
     predicted_risk = class_names[int(predicted_class[0])]
 
-    # Return results
+    # Return results (plain floats: the cache stores them as JSON)
     return {
         "predicted_risk": predicted_risk,
-        "probabilities": {label: prob for label, prob in zip(class_names, predicted_probabilities[0])}
+        "probabilities": {label: prob for label, prob in zip(class_names, predicted_probabilities[0])},
+        "contributions": {field: {label: float(value) for label, value in zip(class_names, values)}
+                          for field, values in zip(fields, contributions[0])},
+        "bias": {label: float(value) for label, value in zip(class_names, inference_engine.bias)},
     }
+
+def predict_batch(records, sparse=True, explain=False):
+    """
+    Predict wildfire risk categories for many structures in one model call.
+
+    Args:
+        records (pd.DataFrame or list of dict): One row per structure, with
+            the same fields as predict_risk's input.
+        sparse (bool): Encode into a CSR matrix, which the engine expands one
+            block at a time. Results are identical to the dense path.
+        explain (bool): Also return each prediction's feature contributions.
+
+    Returns:
+        tuple: (np.ndarray of predicted risk labels,
+        np.ndarray of shape (N, n_classes) with probabilities in class_names
+        order, dict of unmatched input values as reported by the encoder).
+        With ``explain``, a fourth item: np.ndarray of shape (N, n_fields,
+        n_classes) with the contributions of the fields of
+        get_contribution_fields().
+    """
+    with metrics.span("encode", mode="batch"):
+        processed_input, unmatched = get_feature_encoder().encode_batch(records, sparse=sparse)
+
+    # One pass over the trees for the whole block
+    with metrics.span("inference", mode="batch"):
+        if explain:
+            groups, fields = get_contribution_fields()
+            predicted_class, predicted_probabilities, contributions = \
+                get_inference_engine().predict_with_contributions(processed_input, groups, len(fields))
+        else:
+            predicted_class, predicted_probabilities = get_inference_engine().predict_with_proba(processed_input)
+    metrics.increment("batch_rows_total", len(predicted_class))
+
+    predicted_risk = get_class_names()[predicted_class.astype(int)]
+    if explain:
+        return predicted_risk, predicted_probabilities, unmatched, contributions
+    return predicted_risk, predicted_probabilities, unmatched
@@ -0,0 +1,131 @@
+"""
+Bounded memoization for predictions.
+
+An in-memory LRU tier answers repeated requests (Streamlit reruns the script on
+every widget change), and an optional SQLite tier keeps answers across
+restarts. Every entry is tagged with the fingerprint of the model artifacts it
+was computed with; when the fingerprint changes, older entries are dropped.
+"""
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with an optional on-disk tier.
+
+    Args:
+        maxsize (int): Maximum number of entries kept in memory.
+        disk_path (str, optional): SQLite file for the persistent tier.
+            Values stored there must be JSON-serializable.
+    """
+
+    def __init__(self, maxsize=1024, disk_path=None):
+        self.maxsize = maxsize
+        self.disk_path = disk_path
+        self.fingerprint = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def set_fingerprint(self, fingerprint):
+        """
+        Record the fingerprint of the current model artifacts.
+
+        Entries computed with a different fingerprint are discarded.
+        """
+        if fingerprint == self.fingerprint:
+            return
+        with self._lock:
+            if fingerprint == self.fingerprint:
+                return
+            if self.fingerprint is not None:
+                self.invalidations += 1
+            self.fingerprint = fingerprint
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions WHERE fingerprint != ?", (fingerprint,))
+                self._db.commit()
+
+    def get(self, key):
+        """Return the cached value for ``key`` or None."""
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            except KeyError:
+                pass
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM predictions WHERE key = ? AND fingerprint = ?",
+                    (json.dumps(key), self.fingerprint),
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Store ``value`` under ``key`` in every tier."""
+        with self._lock:
+            self._remember(key, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, fingerprint, value) VALUES (?, ?, ?)",
+                    (json.dumps(key), self.fingerprint, json.dumps(value)),
+                )
+                self._db.commit()
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions")
+                self._db.commit()
+
+    def stats(self):
+        """Return hit/miss counters and the current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
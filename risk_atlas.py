@@ -0,0 +1,250 @@
+"""
+Precomputed risk atlas: model output for every known place.
+
+An offline job scores each gazetteer place (the CITY, COUNTY and COMMUNITY
+values the model was trained on) for a few representative building profiles
+and stores the per-class probabilities in one compact ``.npz`` table, next to
+the place centroids. The map then draws real comparative risk across the
+state straight from the table, with no inference per click.
+
+Rows are stored sorted by latitude, so a map viewport is two binary searches
+plus a longitude filter, and places are also indexed by (field, name).
+
+The gazetteer has no place hierarchy, so a city is scored with the county
+whose centroid is nearest, and a community with the nearest city and county.
+
+Usage:
+    python risk_atlas.py                  # writes risk_atlas.npz from the deployed model
+    python risk_atlas.py --output /tmp/atlas.npz
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from gazetteer import PLACE_FIELDS, normalize_name, read_places
+
+logger = logging.getLogger(__name__)
+
+ATLAS_PATH = os.environ.get("RISK_ATLAS_PATH",
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), "risk_atlas.npz"))
+
+# Representative structures; places are added per row. Keys are the columns
+# the features were named after (VEGCLEARAN and ROOFCONSTR, not the app's
+# VEGCLERANCE and ROOFCONSTRUCTR, see prediction.FEATURE_PREFIXES) and values
+# are spelled as in the feature names: years as the strings they were one-hot
+# encoded from, and without the "<>" training stripped (">100'" is "100'",
+# "Mesh Screen <= 1/8\"" is 'Mesh Screen = 1/8"'). build_atlas refuses a
+# profile value the model has no feature for.
+PROFILES = {
+    "typical": {
+        "STRUCTURET_STANDARDIZED": "Single Family Residence", "ROOFCONSTR": "Asphalt",
+        "EAVES": "Unenclosed", "VENTSCREEN": 'Mesh Screen = 1/8"', "EXTERIORSI": "Combustible",
+        "WINDOWPANE": "Multi Pane", "TOPOGRAPHY": "Flat Ground", "VEGCLEARAN": "0-30'", "YEARBUILT": "1975",
+    },
+    "hardened": {
+        "STRUCTURET_STANDARDIZED": "Single Family Residence", "ROOFCONSTR": "Fire Resistant",
+        "EAVES": "Enclosed", "VENTSCREEN": 'Mesh Screen = 1/8"', "EXTERIORSI": "Ignition Resistant",
+        "WINDOWPANE": "Multi Pane", "TOPOGRAPHY": "Flat Ground", "VEGCLEARAN": "100'", "YEARBUILT": "2010",
+    },
+    "vulnerable": {
+        "STRUCTURET_STANDARDIZED": "Mobile Home", "ROOFCONSTR": "Combustible",
+        "EAVES": "Unenclosed", "VENTSCREEN": "Unscreened", "EXTERIORSI": "Combustible",
+        "WINDOWPANE": "Single Pane", "TOPOGRAPHY": "Slope", "VEGCLEARAN": "0-30'", "YEARBUILT": "1960",
+    },
+}
+DEFAULT_PROFILE = os.environ.get("RISK_ATLAS_PROFILE", "typical")
+
+# Classes whose combined probability colours the map
+SEVERE_CLASSES = ("Major (26-50%)", "Destroyed (>50%)")
+
+
+class RiskAtlas:
+    """
+    Per-place, per-profile class probabilities with centroids.
+
+    Args:
+        fields (np.ndarray): Index into PLACE_FIELDS for each place.
+        names (np.ndarray): Place names.
+        lats (np.ndarray): Centroid latitudes, ascending.
+        lons (np.ndarray): Centroid longitudes.
+        profiles (sequence): Profile names.
+        class_names (sequence): Risk labels, in probability column order.
+        probabilities (np.ndarray): float32 of shape (places, profiles, classes).
+        model (str): Fingerprint of the model the atlas was built from.
+    """
+
+    def __init__(self, fields, names, lats, lons, profiles, class_names, probabilities, model=""):
+        self.fields = fields
+        self.names = names
+        self.lats = lats
+        self.lons = lons
+        self.profiles = [str(profile) for profile in profiles]
+        self.class_names = [str(label) for label in class_names]
+        self.probabilities = probabilities
+        self.model = str(model)
+        self._rows = {(PLACE_FIELDS[field], normalize_name(name)): row
+                      for row, (field, name) in enumerate(zip(fields, names))}
+
+    def __len__(self):
+        return len(self.names)
+
+    def profile_index(self, profile):
+        try:
+            return self.profiles.index(profile)
+        except ValueError:
+            raise ValueError(f"Unknown atlas profile {profile!r}; expected one of {self.profiles}") from None
+
+    def lookup(self, field, name):
+        """Return the row of a CITY, COUNTY or COMMUNITY value, or None."""
+        return self._rows.get((field, normalize_name(name)))
+
+    def distribution(self, field, name, profile=DEFAULT_PROFILE):
+        """Return {risk label: probability} for a place and profile, or None for unknown places."""
+        row = self.lookup(field, name)
+        if row is None:
+            return None
+        values = self.probabilities[row, self.profile_index(profile)]
+        return {label: float(p) for label, p in zip(self.class_names, values)}
+
+    def severity(self, profile=DEFAULT_PROFILE, classes=SEVERE_CLASSES):
+        """Return the probability of ``classes`` combined, for every place."""
+        columns = [self.class_names.index(label) for label in classes if label in self.class_names]
+        return self.probabilities[:, self.profile_index(profile)][:, columns].sum(axis=1)
+
+    def within(self, lat_min, lat_max, lon_min, lon_max):
+        """Return the rows whose centroid falls in the box, in latitude order."""
+        start = np.searchsorted(self.lats, lat_min, side="left")
+        stop = np.searchsorted(self.lats, lat_max, side="right")
+        rows = np.arange(start, stop)
+        return rows[(self.lons[rows] >= lon_min) & (self.lons[rows] <= lon_max)]
+
+
+def _nearest(lat, lon, lats, lons):
+    # Equirectangular distance is plenty to pick the closest centroid
+    dx = (lons - lon) * np.cos(np.radians(lat))
+    return int(np.argmin(dx ** 2 + (lats - lat) ** 2))
+
+
+def place_records(places):
+    """
+    Return one partial input record per place: the place itself plus the
+    nearest centroid of each broader place field.
+
+    Args:
+        places (list): (field, name, lat, lon) rows, as from read_places().
+    """
+    by_field = {field: [place for place in places if place[0] == field] for field in PLACE_FIELDS}
+    centroids = {field: (np.array([p[2] for p in rows]), np.array([p[3] for p in rows]))
+                 for field, rows in by_field.items() if rows}
+
+    records = []
+    for field, name, lat, lon in places:
+        record = {place_field: None for place_field in PLACE_FIELDS}
+        record[field] = name
+        for broader in PLACE_FIELDS[PLACE_FIELDS.index(field) + 1:]:
+            if broader in centroids:
+                record[broader] = by_field[broader][_nearest(lat, lon, *centroids[broader])][1]
+        records.append(record)
+    return records
+
+
+def build_atlas(output_path=ATLAS_PATH, profiles=PROFILES, places=None, log=sys.stderr):
+    """
+    Score every place for every profile and write the atlas.
+
+    All rows are scored in one predict_batch call.
+
+    Raises:
+        ValueError: A profile value matches no model feature; nothing is written.
+
+    Args:
+        output_path (str): ``.npz`` file to write (replaced atomically).
+        profiles (dict): {profile name: input fields}.
+        places (list, optional): (field, name, lat, lon) rows; the gazetteer by default.
+        log (file): Where the summary line is printed.
+
+    Returns:
+        RiskAtlas: The atlas written.
+    """
+    import prediction
+
+    started = time.perf_counter()
+    places = sorted(read_places() if places is None else places, key=lambda place: (place[2], place[3]))
+    records = place_records(places)
+    rows = [{**profile, **record} for record in records for profile in profiles.values()]
+    _, probabilities, unmatched = prediction.predict_batch(rows)
+    profile_fields = {field for profile in profiles.values() for field in profile}
+    unmatched = {field: sorted(map(str, values)) for field, values in unmatched.items() if field in profile_fields}
+    if unmatched:
+        raise ValueError(f"Profile values with no model feature: {unmatched}")
+
+    atlas = RiskAtlas(
+        fields=np.array([PLACE_FIELDS.index(place[0]) for place in places], dtype=np.uint8),
+        names=np.array([place[1] for place in places], dtype=str),
+        lats=np.array([place[2] for place in places], dtype=np.float32),
+        lons=np.array([place[3] for place in places], dtype=np.float32),
+        profiles=list(profiles),
+        class_names=prediction.get_class_names(),
+        probabilities=probabilities.reshape(len(places), len(profiles), -1).astype(np.float32),
+        model=prediction.artifact_fingerprint(),
+    )
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez_compressed(file, fields=atlas.fields, names=atlas.names, lats=atlas.lats, lons=atlas.lons,
+                            profiles=np.array(atlas.profiles, dtype=str),
+                            class_names=np.array(atlas.class_names, dtype=str),
+                            probabilities=atlas.probabilities, model=np.array(atlas.model))
+    os.replace(tmp_path, output_path)
+    print(f"Scored {len(places)} places x {len(profiles)} profiles in "
+          f"{time.perf_counter() - started:.2f}s -> {output_path}", file=log)
+    return atlas
+
+
+def load_atlas(path=ATLAS_PATH):
+    """Read an atlas written by build_atlas."""
+    with np.load(path, allow_pickle=False) as data:
+        return RiskAtlas(data["fields"], data["names"], data["lats"], data["lons"], data["profiles"],
+                         data["class_names"], data["probabilities"], model=data["model"])
+
+
+_default_atlas = None
+_default_atlas_lock = threading.Lock()
+
+
+def get_atlas():
+    """
+    Return the process-wide atlas from ATLAS_PATH, or None when it has not been built.
+
+    The file is read once. An atlas built from another model is still used,
+    with a warning, until it is rebuilt.
+    """
+    global _default_atlas
+    if _default_atlas is None:
+        with _default_atlas_lock:
+            if _default_atlas is None:
+                if not os.path.exists(ATLAS_PATH):
+                    return None
+                atlas = load_atlas(ATLAS_PATH)
+                from prediction import artifact_fingerprint
+
+                if atlas.model != artifact_fingerprint():
+                    logger.warning(f"{ATLAS_PATH} was built from a different model; rebuild it with risk_atlas.py.")
+                _default_atlas = atlas
+    return _default_atlas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute model risk for every known place.")
+    parser.add_argument("--output", default=ATLAS_PATH, help="atlas file to write (default: %(default)s)")
+    args = parser.parse_args(argv)
+    build_atlas(args.output)
+
+
+if __name__ == "__main__":
+    main()
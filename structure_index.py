@@ -0,0 +1,213 @@
+"""
+Nearest inspected structures, by Hamming distance over bit-packed one-hot rows.
+
+Every structure in the DINS extract encodes to 367 one-hot features with at
+most one bit set per input field. Packed 64 to a word, a row is six uint64
+words (48 bytes), so the whole extract fits in a few megabytes and no dense
+float matrix is ever built. A query XORs its packed row against every
+stored row, counts the differing bits with ``np.bitwise_count`` and keeps
+the k smallest: the structures that differ from it in the fewest fields,
+as the notebook's KNN experiment measured similarity on the same encoding.
+Words are held word-major (one contiguous array per word), which keeps each
+pass a flat vector operation; a query over 200,000 rows takes a few milliseconds.
+
+The index is written by train.py next to the model and loaded by the app:
+    index = get_structure_index()            # None until train.py has run
+    neighbours = index.similar(user_input, k=10)
+"""
+import os
+import threading
+
+import numpy as np
+
+from feature_encoder import FeatureEncoder
+from prediction import FEATURE_PREFIXES
+
+INDEX_PATH = os.environ.get("STRUCTURE_INDEX_PATH",
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), "structure_index.npz"))
+
+WORD_BITS = 64
+
+
+def n_words(n_features):
+    return -(-n_features // WORD_BITS)
+
+
+def pack_rows(X, n_features=None):
+    """
+    Pack the non-zero pattern of each row into uint64 words.
+
+    Args:
+        X: CSR matrix or dense array of shape (rows, features). Only which
+            entries are non-zero matters.
+        n_features (int, optional): Width to pack to; X.shape[1] by default.
+
+    Returns:
+        np.ndarray: uint64 array of shape (rows, ceil(features / 64)); bit
+        ``j % 64`` of word ``j // 64`` is feature ``j``.
+    """
+    from scipy import sparse
+
+    X = sparse.csr_matrix(X)
+    X.eliminate_zeros()
+    words = n_words(n_features or X.shape[1])
+    packed = np.zeros((X.shape[0], words), dtype=np.uint64)
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+    columns = X.indices.astype(np.uint64)
+    np.bitwise_or.at(packed.reshape(-1), rows * words + (columns // WORD_BITS).astype(np.intp),
+                     np.left_shift(np.uint64(1), columns % np.uint64(WORD_BITS)))
+    return packed
+
+
+class StructureIndex:
+    """
+    Packed one-hot rows of inspected structures and their observed damage.
+
+    Args:
+        packed (np.ndarray): uint64 (rows, words) from pack_rows.
+        labels (np.ndarray): Class index of each row's DAMAGE label.
+        class_names (sequence): Damage labels, indexed by ``labels``.
+        feature_names (list): Feature names the rows were encoded with.
+        columns (sequence): Source columns behind the features, to read rows back as fields.
+    """
+
+    def __init__(self, packed, labels, class_names, feature_names, columns):
+        packed = np.asarray(packed, dtype=np.uint64)
+        self.labels = np.asarray(labels)
+        self.class_names = np.array([str(label) for label in class_names], dtype=object)
+        self.feature_names = list(feature_names)
+        self.columns = [str(column) for column in columns]
+        self.encoder = FeatureEncoder(self.feature_names, aliases=FEATURE_PREFIXES)
+        # Feature -> (column, value), splitting at the longest column prefix
+        self._fields = []
+        for name in self.feature_names:
+            column = max((c for c in self.columns if name.startswith(c + "_")), key=len, default=name)
+            self._fields.append((column, name[len(column) + 1:]))
+        if packed.shape != (len(self.labels), n_words(len(self.feature_names))):
+            raise ValueError(f"Packed rows {packed.shape} do not match {len(self.labels)} labels "
+                             f"and {len(self.feature_names)} features.")
+        # (words, rows): each word of every row is one contiguous vector
+        self.words = np.ascontiguousarray(packed.T)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def pack_query(self, record):
+        """
+        Encode one input record (the app's fields) and pack it like the stored rows.
+
+        The record is encoded as predict_risk encodes it, except that the
+        app's VEGCLERANCE and ROOFCONSTRUCTR are read as the truncated
+        columns the stored rows were encoded from (FEATURE_PREFIXES), which
+        the model's own encoder leaves unmatched. A numeric YEARBUILT sets
+        no bit, as in predict_risk.
+        """
+        row, _ = self.encoder.encode(record)
+        return pack_rows(row, len(self.feature_names))[0]
+
+    def search(self, query, k=10):
+        """
+        Return the ``k`` stored rows nearest a packed query.
+
+        Returns:
+            tuple: (row indices, Hamming distances), nearest first; ties
+            keep the stored order.
+        """
+        k = min(k, len(self))
+        distances = np.zeros(len(self), dtype=np.uint16)
+        for word, query_word in zip(self.words, query):
+            distances += np.bitwise_count(word ^ query_word)
+
+        # Distance in the high bits, row in the low bits: one partition, stable ties
+        keys = (distances.astype(np.uint64) << np.uint64(32)) | np.arange(len(self), dtype=np.uint64)
+        nearest = np.partition(keys, k - 1)[:k] if k < len(self) else keys
+        nearest = np.sort(nearest)
+        return (nearest & np.uint64(0xFFFFFFFF)).astype(np.intp), (nearest >> np.uint64(32)).astype(np.intp)
+
+    def describe(self, row):
+        """Return {column: value} of a stored row."""
+        return self._decode(self.words[:, row])
+
+    def _decode(self, words):
+        words = np.ascontiguousarray(words, dtype=np.uint64)
+        bits = np.unpackbits(words.view(np.uint8), bitorder="little")[:len(self.feature_names)]
+        return dict(self._fields[i] for i in np.flatnonzero(bits))
+
+    def similar(self, record, k=10):
+        """
+        Find the inspected structures most like ``record``.
+
+        Returns:
+            list of dict: ``row`` (position in the training data), ``damage``
+            (the observed DAMAGE label), ``differences`` (Hamming distance:
+            two bits per field that differs, one per field set on one side
+            only), ``fields`` ({column: value} of the structure) and
+            ``fields_differing`` (columns whose values differ from the query's).
+        """
+        query = self.pack_query(record)
+        query_fields = self._decode(query)
+        rows, distances = self.search(query, k)
+        neighbours = []
+        for row, distance in zip(rows, distances):
+            fields = self.describe(row)
+            neighbours.append({
+                "row": int(row),
+                "damage": self.class_names[self.labels[row]],
+                "differences": int(distance),
+                "fields": fields,
+                "fields_differing": sum(fields.get(c) != query_fields.get(c) for c in self.columns),
+            })
+        return neighbours
+
+    def damage_counts(self, neighbours):
+        """Return {DAMAGE label: count} over the results of similar()."""
+        counts = {}
+        for neighbour in neighbours:
+            counts[neighbour["damage"]] = counts.get(neighbour["damage"], 0) + 1
+        return counts
+
+
+def write_index(path, X, y, class_names, feature_names, columns):
+    """
+    Pack an encoded dataset and write it as an index.
+
+    Args:
+        path (str): ``.npz`` file to write (replaced atomically).
+        X: Encoded rows (CSR or dense), as train.encode_dataset returns.
+        y (np.ndarray): Class index per row.
+        class_names (sequence): Labels for ``y``.
+        feature_names (list): Feature names of X's columns.
+        columns (sequence): Source columns the features were encoded from.
+
+    Returns:
+        StructureIndex: The index written.
+    """
+    index = StructureIndex(pack_rows(X, len(feature_names)), y, class_names, feature_names, columns)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez(file, words=index.words, labels=index.labels.astype(np.uint8),
+                 class_names=np.array(index.class_names, dtype=str),
+                 feature_names=np.array(index.feature_names, dtype=str),
+                 columns=np.array(index.columns, dtype=str))
+    os.replace(tmp_path, path)
+    return index
+
+
+def load_index(path=INDEX_PATH):
+    with np.load(path, allow_pickle=False) as data:
+        return StructureIndex(data["words"].T, data["labels"], data["class_names"], data["feature_names"].tolist(),
+                              data["columns"].tolist())
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_structure_index():
+    """Return the process-wide index from INDEX_PATH, or None when it has not been built."""
+    global _default_index
+    if _default_index is None:
+        with _default_index_lock:
+            if _default_index is None and os.path.exists(INDEX_PATH):
+                _default_index = load_index(INDEX_PATH)
+    return _default_index
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.ensemble import RandomForestClassifier
+
+from forest_engine import FlatForest
+
+
+@pytest.fixture(scope="module")
+def forest():
+    rng = np.random.default_rng(0)
+    X = rng.integers(0, 2, size=(200, 12)).astype(np.float32)
+    y = rng.integers(0, 3, size=200)
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)
+    return FlatForest.from_sklearn(model)
+
+
+@pytest.mark.parametrize("compiled", [True, False])
+def test_empty_input(forest, compiled):
+    if not compiled:
+        forest = FlatForest(forest.feature, forest.threshold, forest.children, forest.missing_go_to_left,
+                            forest.value, forest.roots, forest.classes_)
+    X = np.empty((0, 12), dtype=np.float32)
+
+    assert forest.apply(X).shape == (forest.n_trees, 0)
+    for rows in (X, sparse.csr_matrix(X)):
+        predicted, proba = forest.predict_with_proba(rows)
+        assert predicted.shape == (0,)
+        assert proba.shape == (0, forest.n_classes)
@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+import mitigation
+import prediction
+
+pytestmark = pytest.mark.skipif(
+    not os.path.exists(prediction.MODEL_PATH) and not os.path.isdir(prediction.BUNDLE_PATH),
+    reason="no trained model")
+
+STRUCTURE = {
+    "COUNTY": "Sonoma", "CITY": "Santa Rosa", "STRUCTURET_STANDARDIZED": "Single Family Residence",
+    "ROOFCONSTRUCTR": "Asphalt", "EAVES": "Unenclosed", "VENTSCREEN": "Unscreened",
+    "EXTERIORSI": "Ignition Resistant", "WINDOWPANE": "Single Pane", "TOPOGRAPHY": "Slope",
+    "VEGCLERANCE": "30-60'", "YEARBUILT": 1960,
+}
+
+
+def test_no_variant_recommends_an_excluded_option():
+    result = mitigation.sweep(STRUCTURE, limit=None)
+
+    assert result["variants"]
+    for variant in result["variants"]:
+        for field, value in variant["changes"].items():
+            assert value not in mitigation.EXCLUDED_OPTIONS[field], (field, value)
+
+
+def test_vegetation_and_roof_are_swept():
+    changed = {field for variant in mitigation.sweep(STRUCTURE, limit=None)["variants"]
+               for field in variant["changes"]}
+
+    assert {"VEGCLERANCE", "ROOFCONSTRUCTR"} <= changed
@@ -0,0 +1,29 @@
+import numpy as np
+
+import prediction
+from structure_index import StructureIndex, pack_rows
+
+FEATURE_NAMES = ["CITY_Paradise", "CITY_Santa Rosa", "VEGCLEARAN_0-30'", "VEGCLEARAN_30-60'",
+                 "ROOFCONSTR_Asphalt", "ROOFCONSTR_Metal", "YEARBUILT_1975"]
+COLUMNS = ["CITY", "VEGCLEARAN", "ROOFCONSTR", "YEARBUILT"]
+RECORD = {"CITY": "Paradise", "VEGCLERANCE": "30-60'", "ROOFCONSTRUCTR": "Metal", "YEARBUILT": 1975}
+
+
+def build_index():
+    rows = np.array([[1, 0, 1, 0, 1, 0, 1], [1, 0, 0, 1, 0, 1, 1]], dtype=np.float32)
+    return StructureIndex(pack_rows(rows), [0, 1], ["No Damage", "Destroyed (>50%)"], FEATURE_NAMES, COLUMNS)
+
+
+def test_query_reads_app_fields_as_training_columns():
+    index = build_index()
+
+    assert index._decode(index.pack_query(RECORD)) == {"CITY": "Paradise", "VEGCLEARAN": "30-60'",
+                                                       "ROOFCONSTR": "Metal"}
+    assert [neighbour["row"] for neighbour in index.similar(RECORD, k=1)] == [1]
+
+
+def test_model_encoder_is_not_aliased():
+    # Model input stays get_dummies + reindex: the app's keys match no feature
+    _, unmatched = prediction.get_feature_encoder().encode(RECORD)
+
+    assert {"VEGCLERANCE", "ROOFCONSTRUCTR", "YEARBUILT"} <= set(unmatched)